@@ -0,0 +1,107 @@
+import logging
+import time
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WARN_INTERVAL = 60.0  # повторное предупреждение об отказе — не чаще, чем раз в столько секунд
+
+
+# === TOKEN BUCKET ПО КЛЮЧУ ===
+class TokenBuckets:
+    """На каждый ключ — корзина до burst токенов, пополняется со скоростью rate в секунду.
+
+    Корзины создаются при первом обращении; когда ключей больше max_keys, удаляются уже
+    полные (ключ простаивает, и новая корзина была бы такой же).
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}  # ключ → [токены, время последнего пополнения]
+
+    def _refill(self, key) -> list:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = self._buckets[key] = [self.burst, now]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        return bucket
+
+    def wait(self, key, cost: float = 1.0) -> float:
+        """Как take, но ничего не списывает"""
+        return max(0.0, (cost - self._refill(key)[0]) / self.rate)
+
+    def take(self, key, cost: float = 1.0) -> float:
+        """Списывает cost токенов; 0 — разрешено, иначе сколько секунд ждать до следующей попытки"""
+        bucket = self._refill(key)
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / self.rate
+
+    def _prune(self, now: float):
+        full = [k for k, (tokens, at) in self._buckets.items() if tokens + (now - at) * self.rate >= self.burst]
+        for k in full:
+            del self._buckets[k]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+# === ДОПУСК К ТЯЖЁЛЫМ ОПЕРАЦИЯМ ===
+class AdmissionControl:
+    """Лимиты на пользователя и на групповой чат перед скачиванием и рендером.
+
+    Отказ по лимиту сообщается один раз, пока ключ снова не пройдёт или не пройдёт WARN_INTERVAL, —
+    чтобы на спам не отвечать спамом. Переполнение очереди рендера проверяет RenderPool, здесь только счётчик.
+    """
+
+    def __init__(self, user_rate: float = 0.0, user_burst: float = 5, chat_rate: float = 0.0, chat_burst: float = 15):
+        self.users = TokenBuckets(user_rate, user_burst) if user_rate > 0 else None
+        self.chats = TokenBuckets(chat_rate, chat_burst) if chat_rate > 0 else None
+        self._warned = OrderedDict()  # user_id → когда предупреждение устареет; по возрастанию
+        self.admitted = 0
+        self.rejected = {"user": 0, "chat": 0, "busy": 0}
+
+    def check(self, user_id: int, chat_id: int = None) -> tuple:
+        """(None, 0) — можно; иначе (причина "user"/"chat", секунды до следующей попытки).
+        Токен списывается, только если пропускают обе корзины: отказ чата не тратит лимит пользователя"""
+        checks = [(reason, buckets, key) for reason, buckets, key in
+                  (("user", self.users, user_id), ("chat", self.chats, chat_id))
+                  if buckets is not None and key is not None]
+        for reason, buckets, key in checks:
+            wait = buckets.wait(key)
+            if wait:
+                self.reject(reason)
+                return reason, wait
+        for _, buckets, key in checks:
+            buckets.take(key)
+        self._warned.pop(user_id, None)
+        self.admitted += 1
+        return None, 0.0
+
+    def should_warn(self, user_id: int) -> bool:
+        """True только для первого отказа подряд (и снова — через WARN_INTERVAL)"""
+        now = time.monotonic()
+        # Срок у всех одинаковый, поэтому устаревшие — в начале: словарь не растёт дольше WARN_INTERVAL
+        while self._warned and next(iter(self._warned.values())) <= now:
+            self._warned.popitem(last=False)
+        if user_id in self._warned:
+            return False
+        self._warned[user_id] = now + WARN_INTERVAL
+        return True
+
+    def reject(self, reason: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        metrics.ADMISSION_REJECTED.inc(reason=reason)
+
+    def stats(self) -> dict:
+        return {"admitted": self.admitted, "rejected": dict(self.rejected),
+                "user_buckets": len(self.users or ()), "chat_buckets": len(self.chats or ()), "warned": len(self._warned)}
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+ALBUM_LIMIT = 10  # sendMediaGroup принимает от 2 до 10 элементов
+
+
+# === СБОРКА АЛЬБОМОВ (media_group_id) ===
+class AlbumCollector:
+    """Telegram присылает альбом отдельными апдейтами с общим media_group_id.
+
+    Элементы копятся по группе; каждый новый продлевает ожидание на delay. Когда новых нет
+    (или набралось ALBUM_LIMIT), on_complete(items) вызывается один раз для всего альбома.
+    """
+
+    def __init__(self, delay: float = 1.0):
+        self.delay = delay
+        self._groups = {}  # media_group_id -> [элементы, задача ожидания, on_complete]
+        self._tasks = set()
+        self.albums = 0
+
+    def add(self, group_id: str, item, on_complete):
+        group = self._groups.get(group_id)
+        if group is None:
+            group = self._groups[group_id] = [[], None, on_complete]
+        group[0].append(item)
+        if group[1] is not None:
+            group[1].cancel()
+        delay = 0 if len(group[0]) >= ALBUM_LIMIT else self.delay
+        group[1] = self._spawn(self._flush(group_id, delay))
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush(self, group_id: str, delay: float):
+        await asyncio.sleep(delay)
+        items, _, on_complete = self._groups.pop(group_id)
+        self.albums += 1
+        try:
+            await on_complete(items)
+        except Exception as e:
+            logger.error(f"Ошибка обработки альбома {group_id}: {e}", exc_info=True)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._groups.clear()
+
+    def stats(self) -> dict:
+        return {"pending": len(self._groups), "albums": self.albums}
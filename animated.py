@@ -0,0 +1,174 @@
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from PIL import Image, ImageSequence
+
+import config
+from decode import open_image
+from renderers import draw_classic_captions, paste_watermark
+
+logger = logging.getLogger(__name__)
+
+GIF_MAGIC = (b'GIF87a', b'GIF89a')
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def _fit_size(w: int, h: int, max_side: int) -> tuple:
+    """Размер кадра не больше max_side, стороны чётные (нужно для H.264)"""
+    scale = min(1.0, max_side / max(w, h))
+    return max(2, int(w * scale) // 2 * 2), max(2, int(h * scale) // 2 * 2)
+
+
+def build_overlay(size: tuple, top_text: str, bottom_text: str, font_key: str) -> Image.Image:
+    """Подписи и водяной знак растеризуются один раз в прозрачный слой"""
+    overlay = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw_classic_captions(overlay, top_text, bottom_text, font_key)
+    paste_watermark(overlay, (255, 255, 255, 128), 10, 20)
+    return overlay
+
+
+# === ИСТОЧНИКИ КАДРОВ ===
+def _gif_frames(path: str, max_side: int, max_frames: int):
+    """Кадры GIF через Pillow: (размер, fps, генератор RGB-кадров)"""
+    im = open_image(path)
+    size = _fit_size(im.width, im.height, max_side)
+    duration = im.info.get('duration') or 100
+    fps = max(1.0, min(50.0, 1000.0 / duration))
+
+    def frames():
+        for i, frame in enumerate(ImageSequence.Iterator(im)):
+            if i >= max_frames:
+                break
+            frame = frame.convert('RGB')
+            if frame.size != size:
+                frame = frame.resize(size, Image.Resampling.BILINEAR)
+            yield frame
+    return size, fps, frames()
+
+
+def _probe(path: str) -> tuple:
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height,avg_frame_rate", "-of", "json", path],
+        capture_output=True, check=True, timeout=30,
+    ).stdout
+    stream = json.loads(out)["streams"][0]
+    num, _, den = stream.get("avg_frame_rate", "25/1").partition('/')
+    fps = float(num) / float(den or 1) if float(num or 0) else 25.0
+    return int(stream["width"]), int(stream["height"]), fps
+
+
+def _video_frames(path: str, max_side: int, max_frames: int):
+    """Кадры видео через пайп ffmpeg: сырые RGB24, по одному кадру в памяти"""
+    w, h, fps = _probe(path)
+    size = _fit_size(w, h, max_side)
+    fps = max(1.0, min(fps, 30.0))
+
+    def frames():
+        proc = subprocess.Popen(
+            ["ffmpeg", "-v", "error", "-i", path, "-an", "-frames:v", str(max_frames),
+             "-vf", f"fps={fps},scale={size[0]}:{size[1]}", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        frame_bytes = size[0] * size[1] * 3
+        try:
+            while True:
+                chunk = proc.stdout.read(frame_bytes)
+                if len(chunk) < frame_bytes:
+                    break
+                yield Image.frombuffer('RGB', size, chunk, 'raw', 'RGB', 0, 1)
+        finally:
+            proc.stdout.close()
+            proc.kill()
+            proc.wait()
+    return size, fps, frames()
+
+
+# === КОДИРОВАНИЕ ===
+def _encode_mp4(frames, size: tuple, fps: float, overlay: Image.Image, out_path: str) -> int:
+    """Кадры по одному уходят в stdin ffmpeg (H.264 MP4); возвращает число кадров"""
+    proc = subprocess.Popen(
+        ["ffmpeg", "-v", "error", "-y", "-f", "rawvideo", "-pix_fmt", "rgb24",
+         "-s", f"{size[0]}x{size[1]}", "-r", f"{fps:.3f}", "-i", "-",
+         "-an", "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+         "-movflags", "+faststart", out_path],
+        stdin=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    count = 0
+    try:
+        for frame in frames:
+            frame = frame.convert('RGBA')
+            frame.alpha_composite(overlay)
+            proc.stdin.write(frame.convert('RGB').tobytes())
+            count += 1
+    finally:
+        proc.stdin.close()
+        code = proc.wait()
+    if code != 0 or count == 0:
+        raise RuntimeError(f"ffmpeg: код {code}, кадров {count}")
+    return count
+
+
+def _encode_gif(frames, fps: float, overlay: Image.Image) -> io.BytesIO:
+    """Запасной вариант без ffmpeg: GIF средствами Pillow.
+
+    Pillow пишет GIF только целиком, поэтому кадры копятся в памяти: сразу в палитре
+    (байт на пиксель вместо трёх), а их число ограничено ANIMATION_GIF_MAX_FRAMES.
+    """
+    composed = []
+    for frame in frames:
+        frame = frame.convert('RGBA')
+        frame.alpha_composite(overlay)
+        composed.append(frame.convert('RGB').convert('P', palette=Image.Palette.ADAPTIVE))
+    if not composed:
+        raise ValueError("В GIF нет кадров")
+    out = io.BytesIO()
+    composed[0].save(out, format='GIF', save_all=True, append_images=composed[1:],
+                     duration=int(1000 / fps), loop=0)
+    out.seek(0)
+    return out
+
+
+# === АНИМИРОВАННЫЙ КЛАССИЧЕСКИЙ МЕМ (GIF / видео) ===
+def create_animated_meme(media_bytes: io.BytesIO, top_text: str, bottom_text: str, font_key: str = "impact",
+                         max_frames: int = None, max_side: int = None) -> io.BytesIO:
+    """Классический мем поверх GIF/видео: на выходе MP4 (или GIF, если нет ffmpeg)"""
+    max_frames = max_frames or config.ANIMATION_MAX_FRAMES
+    max_side = max_side or config.ANIMATION_MAX_SIDE
+    data = media_bytes.getvalue()
+    is_gif = data[:6] in GIF_MAGIC
+    use_ffmpeg = ffmpeg_available()
+    if not is_gif and not use_ffmpeg:
+        raise RuntimeError("Для видео нужен ffmpeg")
+    if not use_ffmpeg:
+        max_frames = min(max_frames, config.ANIMATION_GIF_MAX_FRAMES)
+
+    with tempfile.TemporaryDirectory(prefix="memfy_anim_") as tmp:
+        src = os.path.join(tmp, "input.gif" if is_gif else "input.mp4")
+        with open(src, 'wb') as f:
+            f.write(data)
+        del data
+
+        if is_gif:
+            size, fps, frames = _gif_frames(src, max_side, max_frames)
+        else:
+            size, fps, frames = _video_frames(src, max_side, max_frames)
+        overlay = build_overlay(size, top_text, bottom_text, font_key)
+
+        if not use_ffmpeg:
+            return _encode_gif(frames, fps, overlay)
+
+        dst = os.path.join(tmp, "output.mp4")
+        count = _encode_mp4(frames, size, fps, overlay, dst)
+        logger.info(f"Анимация: {count} кадров {size[0]}x{size[1]} @ {fps:.1f} fps")
+        with open(dst, 'rb') as f:
+            out = io.BytesIO(f.read())
+    return out
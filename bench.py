@@ -0,0 +1,174 @@
+"""Бенчмарк рендеров: classic, demotivator, shakalize на синтетических картинках (без сети).
+
+    python bench.py                       # матрица по одной оси от базового случая
+    python bench.py --full                # полный перебор (долго)
+    python bench.py --engine shakalize --repeat 5
+    python bench.py --save                # записать результат как базовый (bench_baseline.json)
+    python bench.py --threshold 0.15      # сравнить с базовым, регрессия — медленнее/тяжелее на 15%
+
+Каждый случай выполняется в отдельном процессе: пиковая память — прирост max RSS во время рендера.
+Код выхода 1, если есть регрессии относительно базового файла.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: пиковую память не меряем
+    resource = None
+
+from fonts import FONT_FILES, CLASSIC_FONTS, DEMOTIVATOR_FONTS
+from renderers import render_job, FONT_SIZES, BORDER_THICKNESS, SHAKAL_LEVELS
+from warmup import synthetic_jpeg
+
+BASELINE_FILE = "bench_baseline.json"
+
+RESOLUTIONS = {"320": (320, 240), "640": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080), "4k": (3840, 2160)}
+CAPTIONS = {
+    "short": ("КОГДА", "ТО"),
+    "medium": ("Когда забыл сохранить проект", "Но git тебя спас"),
+    "long": ("Когда наконец-то дописал бенчмарк и запустил его на всех разрешениях сразу " * 2,
+             "а он показал, что всё стало медленнее, чем было до оптимизации " * 2),
+}
+DEFAULTS = {"resolution": "720p", "caption": "medium"}
+
+
+# === МАТРИЦА СЛУЧАЕВ ===
+def _case(engine: str, resolution: str, caption: str = None, **params) -> tuple:
+    name = [engine, resolution]
+    if caption is not None:
+        top, bottom = CAPTIONS[caption]
+        params.update(top_text=top, bottom_text=bottom)
+        name.append(caption)
+    for k, v in sorted(params.items()):
+        if k not in ("top_text", "bottom_text"):
+            name.append(f"{k}={'-'.join(map(str, v.values())) if isinstance(v, dict) else v}")
+    return "/".join(name), engine, resolution, params
+
+
+def build_cases(full: bool = False) -> list:
+    """По умолчанию варьируется одна ось за раз вокруг DEFAULTS; full — декартово произведение"""
+    res, cap = DEFAULTS["resolution"], DEFAULTS["caption"]
+    cases = []
+    if full:
+        for r, c, f in itertools.product(RESOLUTIONS, CAPTIONS, FONT_FILES):
+            cases.append(_case("classic", r, c, font_key=f))
+        for r, c, f, s, t in itertools.product(RESOLUTIONS, CAPTIONS, DEMOTIVATOR_FONTS, FONT_SIZES, BORDER_THICKNESS):
+            cases.append(_case("demotivator", r, c, font_key=f, font_size=FONT_SIZES[s],
+                               border_thickness=BORDER_THICKNESS[t]))
+        for r, level in itertools.product(RESOLUTIONS, SHAKAL_LEVELS):
+            cases.append(_case("shakalize", r, intensity=level))
+        cases += [_case("shakalize_sheet", r) for r in RESOLUTIONS]
+    else:
+        # classic: разрешения, подписи, все шрифты
+        cases += [_case("classic", r, cap, font_key=CLASSIC_FONTS[0]) for r in RESOLUTIONS]
+        cases += [_case("classic", res, c, font_key=CLASSIC_FONTS[0]) for c in CAPTIONS if c != cap]
+        cases += [_case("classic", res, cap, font_key=f) for f in FONT_FILES if f != CLASSIC_FONTS[0]]
+        # demotivator: разрешения, подписи, шрифты, размеры, рамки
+        base = {"font_key": DEMOTIVATOR_FONTS[0], "font_size": FONT_SIZES["size_medium"], "border_thickness": 10}
+        cases += [_case("demotivator", r, cap, **base) for r in RESOLUTIONS]
+        cases += [_case("demotivator", res, c, **base) for c in CAPTIONS if c != cap]
+        cases += [_case("demotivator", res, cap, **{**base, "font_key": f}) for f in FONT_FILES
+                  if f != base["font_key"]]
+        cases += [_case("demotivator", res, cap, **{**base, "font_size": v}) for k, v in FONT_SIZES.items()
+                  if k != "size_medium"]
+        cases += [_case("demotivator", res, cap, **{**base, "border_thickness": v}) for v in BORDER_THICKNESS.values()
+                  if v != base["border_thickness"]]
+        # shakalize: все уровни на каждом разрешении и превью всех уровней
+        cases += [_case("shakalize", r, intensity=level) for r in RESOLUTIONS for level in SHAKAL_LEVELS]
+        cases += [_case("shakalize_sheet", r) for r in RESOLUTIONS]
+    return cases
+
+
+# === ЗАПУСК ===
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def run_case(engine: str, data: bytes, params: dict, repeat: int) -> dict:
+    """Выполняется в отдельном процессе: прогрев (шрифты, заготовки) + repeat замеров"""
+    random.seed(0)
+    start_rss = _rss_kb()
+    render_job(engine, data, params)
+    times, size = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(render_job(engine, data, params))
+        times.append((time.perf_counter() - started) * 1000)
+    peak_kb = None
+    if resource is not None and start_rss:
+        peak_kb = max(0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss)
+    return {"wall_ms": round(statistics.median(times), 2), "peak_kb": peak_kb, "bytes": size}
+
+
+def compare(name: str, result: dict, baseline: dict, threshold: float) -> list:
+    base = baseline.get(name)
+    if not base:
+        return []
+    problems = []
+    for metric in ("wall_ms", "peak_kb"):
+        old, new = base.get(metric), result.get(metric)
+        if old and new and new > old * (1 + threshold):
+            problems.append(f"{metric} {old} → {new} (+{(new / old - 1) * 100:.0f}%)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк рендеров memfy_bot")
+    parser.add_argument("--engine", choices=["classic", "demotivator", "shakalize", "shakalize_sheet"], action="append")
+    parser.add_argument("--full", action="store_true", help="полный перебор всех комбинаций")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save", action="store_true", help="сохранить результат как базовый")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    cases = [c for c in build_cases(args.full) if not args.engine or c[1] in args.engine]
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    images = {}
+    results, regressions = {}, []
+    # Колонка по самому длинному имени: варианты одного рендера различаются только хвостом
+    width = max(len(name) for name, *_ in cases)
+    print(f"{'случай':<{width}} {'мс':>9} {'пик КБ':>9} {'байт':>9}")
+    # forkserver: у spawn на Linux max RSS наследуется от родителя через exec и искажает пик
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    with ctx.Pool(1, maxtasksperchild=1) as pool:
+        for name, engine, resolution, params in cases:
+            if resolution not in images:
+                images[resolution] = synthetic_jpeg(RESOLUTIONS[resolution])
+            result = pool.apply(run_case, (engine, images[resolution], params, args.repeat))
+            results[name] = result
+            problems = compare(name, result, baseline, args.threshold)
+            mark = "  РЕГРЕССИЯ: " + "; ".join(problems) if problems else ""
+            peak = result['peak_kb'] if result['peak_kb'] is not None else "—"
+            print(f"{name:<{width}} {result['wall_ms']:>9} {peak:>9} {result['bytes']:>9}{mark}", flush=True)
+            if problems:
+                regressions.append(name)
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1, sort_keys=True)
+        print(f"Базовый результат сохранён: {args.baseline} ({len(results)} случаев)")
+    elif baseline:
+        print(f"Регрессий: {len(regressions)} из {len(results)} (порог {args.threshold * 100:.0f}%)")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,32 @@
+import asyncio
 import logging
-import random
 import os
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageOps
-import io
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, InlineQueryResultCachedPhoto
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import (Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler,
+                          InlineQueryHandler)
+
+import config
+from fonts import registry as font_registry
+from decode import ImageTooLarge
+from media import (mentioned_or_private, mentions_bot, strip_mentions, photo_sizes, animation_ref, pick_size,
+                   download, RENDER_TARGETS, MAX_FILE_SIZE)
+from render_pool import RenderPool, RenderTimeout, RenderBusy
+from admission import AdmissionControl
+from result_cache import ResultCache, cache_key
+from cleanup import MessageCleaner
+from albums import AlbumCollector, ALBUM_LIMIT
+from inline import QueryCache, LatestQueries, parse_inline_query
+from templates import registry as template_registry
+from sessions import SessionStore
+from session_backends import create_backend
+from webhook import serve_webhook, make_ready_handler, ALLOWED_UPDATES
+from update_processor import PerUserUpdateProcessor
+import wizard
+from http_server import HttpServer, text_response
+from warmup import Startup, warm_fonts, warm_renders
+import metrics
+from metrics import MeteredRequest
 
 # === ЛОГИРОВАНИЕ ===
 logging.basicConfig(
@@ -20,39 +42,101 @@ def log_media_processing(user_id: int, action: str, details: str = ""):
 def log_error(user_id: int, error: str, exc_info: bool = False):
     logger.error(f"User {user_id}: {error}", exc_info=exc_info)
 
-# === ШРИФТЫ В ТОЙ ЖЕ ПАПКЕ, ЧТО И bot.py ===
-FONT_DIR = os.path.dirname(__file__)  # ← шрифты рядом с bot.py
-
 # === ХРАНИЛИЩЕ ===
-user_data = {}
-user_messages = {}
-
-# === СПИСОК ШРИФТОВ (должны быть в той же папке) ===
-AVAILABLE_FONT_FILES = [
-    "Molodost.ttf",
-    "Roboto_Bold.ttf",
-    "Times New Roman Bold Italic.ttf",
-    "Nougat Regular.ttf",
-    "Maratype Regular.ttf",
-    "Farabee Bold.ttf",
-    "Impact.ttf",
-    "Anton-Regular.ttf",
-    "Comic Sans MS.ttf",
-    "Arial_black.ttf",
-    "Lobster.ttf",
-]
-
-
-def check_fonts_presence():
-    """Проверка наличия шрифтов в папке с bot.py"""
-    logger.info(f"Проверка шрифтов в: {FONT_DIR}")
-    for fname in AVAILABLE_FONT_FILES:
-        path = os.path.join(FONT_DIR, fname)
-        if os.path.exists(path):
-            logger.info(f"Шрифт найден: {fname}")
-        else:
-            logger.warning(f"Шрифт НЕ найден: {fname} (ищется: {path})")
+sessions = SessionStore(
+    ttl=config.SESSION_TTL, max_bytes=config.SESSION_MAX_BYTES, max_entries=config.SESSION_MAX_ENTRIES,
+    spill=config.SESSION_SPILL, spill_dir=config.SESSION_SPILL_DIR,
+    backend=create_backend(config.SESSION_BACKEND, config.SESSION_DB, config.REDIS_URL),
+)
+
+# === КЭШ ГОТОВЫХ МЕМОВ ===
+result_cache = ResultCache(max_entries=config.RESULT_CACHE_SIZE, db_path=config.RESULT_CACHE_DB)
+
+# === ФОНОВАЯ ОЧИСТКА СООБЩЕНИЙ ===
+cleaner = MessageCleaner()
+
+# === АЛЬБОМЫ (media_group_id) ===
+albums = AlbumCollector(delay=config.ALBUM_DEBOUNCE)
+# Рендеры, которые применяются ко всем фото альбома
+ALBUM_ENGINES = ("classic", "demotivator", "shakalize")
 
+# === ИНЛАЙН-РЕЖИМ ===
+inline_cache = QueryCache(ttl=config.INLINE_CACHE_TTL)
+inline_latest = LatestQueries()
+
+# === ПУЛ РЕНДЕРА ===
+render_pool = RenderPool(workers=config.RENDER_WORKERS, mode=config.RENDER_POOL, timeout=config.RENDER_TIMEOUT,
+                         max_queue=config.RENDER_QUEUE_MAX)
+
+# === ДОПУСК: ЛИМИТЫ ПОЛЬЗОВАТЕЛЯ/ЧАТА И ОЧЕРЕДЬ РЕНДЕРА ===
+admission = AdmissionControl(
+    user_rate=config.USER_RATE_PER_MINUTE / 60, user_burst=config.USER_BURST,
+    chat_rate=config.CHAT_RATE_PER_MINUTE / 60, chat_burst=config.CHAT_BURST,
+)
+BUSY_TEXT = "Сейчас много работы, попробуй чуть позже."
+
+
+async def admit(user_id: int, chat, reply, render: bool = False) -> bool:
+    """Проверка перед скачиванием/рендером; reply(text) — как ответить пользователю.
+    False — отказано (ответ уже отправлен, если он нужен)."""
+    reason, wait = admission.check(user_id, chat.id if chat.type != 'private' else None)
+    if reason:
+        # На спам не отвечаем спамом: предупреждение одно, до следующего успешного запроса
+        if admission.should_warn(user_id):
+            where = " в этом чате" if reason == "chat" else ""
+            await reply(f"Слишком часто{where}. Подожди {max(1, round(wait))} с.")
+        return False
+    if render:
+        if render_pool.is_full():
+            admission.reject("busy")
+            await reply(BUSY_TEXT)
+            return False
+        position = render_pool.queue_position()
+        if position:
+            sent = await reply(f"Ты в очереди: {position}-й. Мем скоро будет!")
+            sessions.messages(user_id).append(sent.message_id)
+    return True
+
+# === ХОЛОДНЫЙ СТАРТ: фазы запуска и готовность (GET /readyz) ===
+startup = Startup()
+
+# === МЕТРИКИ (Prometheus, GET /metrics) ===
+metrics_server = None
+
+
+def register_metrics(app: Application):
+    """Снимки состояния компонентов — считаются при каждом запросе /metrics"""
+    reg = metrics.registry
+    reg.gauge("memfy_ready", "Бот прогрет и принимает апдейты", lambda: int(startup.ready))
+    reg.gauge("memfy_renders_in_flight", "Рендеры в работе", lambda: render_pool.in_flight)
+    reg.gauge("memfy_render_pool_utilization", "Загрузка пула рендера с запуска", render_pool.utilization)
+    reg.gauge("memfy_renders_total", "Рендеры по исходу", lambda: {
+        "ok": render_pool.completed, "error": render_pool.failed, "timeout": render_pool.timeouts,
+    }, "result", kind="counter")
+    reg.gauge("memfy_sessions", "Сессии мастера в хранилище", lambda: len(sessions))
+    reg.gauge("memfy_session_bytes", "Байты фото в сессиях", lambda: {
+        "memory": sessions.bytes_in_memory, "disk": sessions.bytes_on_disk,
+    }, "where")
+    reg.gauge("memfy_result_cache_entries", "Записей в кэше готовых мемов", lambda: result_cache.stats()["entries"])
+    reg.gauge("memfy_result_cache_lookups_total", "Обращения к кэшу готовых мемов", lambda: {
+        "hit": result_cache.hits, "miss": result_cache.misses,
+    }, "result", kind="counter")
+    reg.gauge("memfy_inline_cache_lookups_total", "Обращения к кэшу инлайн-ответов", lambda: {
+        "hit": inline_cache.hits, "miss": inline_cache.misses,
+    }, "result", kind="counter")
+    reg.gauge("memfy_inline_superseded_total", "Инлайн-запросы, не отрендеренные из-за более нового",
+              lambda: inline_latest.superseded, kind="counter")
+    reg.gauge("memfy_render_queue_depth", "Рендеры, ждущие свободного воркера", lambda: render_pool.queued)
+    reg.gauge("memfy_cleanup_pending", "Удаления сообщений в очереди", lambda: cleaner.stats()["pending"])
+    reg.gauge("memfy_updates_in_flight", "Апдейты в обработке и в очереди",
+              lambda: app.update_processor.current_concurrent_updates)
+
+
+async def metrics_handler(request):
+    return text_response(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+ready_handler = make_ready_handler(startup)
 
 # === /start ===
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -74,320 +158,152 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "2. Выбери тип: мем или демотиватор\n"
             "3. Настрой шрифт, размер, цвет, фон, рамку\n"
             "4. Отправь текст: 'Верхний|Нижний'\n\n"
+            "/template — мем на готовом шаблоне\n"
             "Работает в личке и группах!"
         )
 
 
-# === /size (для демотиваторов) ===
-async def size_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [
-        [InlineKeyboardButton("Маленький", callback_data="size_small"),
-         InlineKeyboardButton("Средний", callback_data="size_medium")],
-        [InlineKeyboardButton("Большой", callback_data="size_large"),
-         InlineKeyboardButton("Очень большой", callback_data="size_xlarge")],
-        [InlineKeyboardButton("Назад", callback_data="action_back"),
-         InlineKeyboardButton("Отмена", callback_data="action_cancel")],
-    ]
-    await update.message.reply_text(
-        "Выбери размер шрифта:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
-    )
+# === /template: МЕМ НА ШАБЛОНЕ ИЗ memes/ ===
+TEMPLATE_LIST_LIMIT = 40  # кнопок в списке шаблонов
 
 
-# === КНОПКИ ===
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    user_id = query.from_user.id
+def select_template(user_id: int, name: str) -> InlineKeyboardMarkup:
+    """Шаблон вместо фото в сессии; дальше обычный мастер (без шакализации)"""
+    ud = sessions.get(user_id)
+    sessions.pop_photo(user_id)
+    for key in ['photo_sizes', 'album', 'animation', 'preview_message_id',
+                'caption_top', 'caption_bottom']:
+        ud.pop(key, None)
+    ud['template'] = name
+    return wizard.start(ud)
 
-    if user_id not in user_data:
-        user_data[user_id] = {}
 
-    # === ОТМЕНА ===
-    if query.data == "action_cancel":
-        if user_id in user_messages:
-            for msg_id in list(user_messages[user_id]):
-                try:
-                    await context.bot.delete_message(chat_id=query.message.chat.id, message_id=msg_id)
-                except:
-                    pass
-            user_messages[user_id] = []
-        user_data[user_id] = {}
-        await query.edit_message_text("Генерация отменена. Прикрепи новое фото! :)")
+async def template_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/template [имя или тег] — мем на готовом шаблоне, без загрузки фото"""
+    user_id = update.effective_user.id
+    names = template_registry.names()
+    if not names:
+        await update.message.reply_text("Шаблонов пока нет.")
         return
-
-    # === НАЗАД ===
-    if query.data == "action_back":
-        ud = user_data.get(user_id, {})
-        if 'font_file' in ud and ud.get('meme_type') == 'meme_demotivator':
-            ud.pop('font_file', None)
-            await query.edit_message_text("Выбери шрифт:", reply_markup=show_font_selection(user_id))
-            return
-        if 'font_size' in ud:
-            ud.pop('font_size', None)
-            keyboard = [
-                [InlineKeyboardButton("Маленький", callback_data="size_small"),
-                 InlineKeyboardButton("Средний", callback_data="size_medium")],
-                [InlineKeyboardButton("Большой", callback_data="size_large"),
-                 InlineKeyboardButton("Очень большой", callback_data="size_xlarge")],
-                [InlineKeyboardButton("Назад", callback_data="action_back"),
-                 InlineKeyboardButton("Отмена", callback_data="action_cancel")],
-            ]
-            await query.edit_message_text("Выбери размер:", reply_markup=InlineKeyboardMarkup(keyboard))
-            return
-        if 'demotivator_type' in ud:
-            ud.pop('demotivator_type', None)
-            await query.edit_message_text("Выбери шрифт:", reply_markup=show_font_selection(user_id))
-            return
-        if 'meme_type' in ud:
-            ud.pop('meme_type', None)
-            keyboard = [
-                [InlineKeyboardButton("Классический мем", callback_data="meme_classic")],
-                [InlineKeyboardButton("Демотиватор", callback_data="meme_demotivator")],
-                [InlineKeyboardButton("Зашакалить", callback_data="shakalize_menu")],
-                [InlineKeyboardButton("Отмена", callback_data="action_cancel")],
-            ]
-            await query.edit_message_text("Выбери тип:", reply_markup=InlineKeyboardMarkup(keyboard))
-            return
-        await query.edit_message_text("Нечего возвращать.")
+    search = " ".join(context.args or [])
+    matches = template_registry.find(search) if search else names
+    if not matches:
+        await update.message.reply_text(f"Шаблон «{search}» не найден. /template — список всех.")
         return
 
-    # === РАЗМЕР ШРИФТА ===
-    size_map = {
-        "size_small": {"top": 30, "bottom": 20},
-        "size_medium": {"top": 40, "bottom": 28},
-        "size_large": {"top": 50, "bottom": 35},
-        "size_xlarge": {"top": 60, "bottom": 40},
-    }
-    if query.data in size_map:
-        user_data[user_id]['font_size'] = size_map[query.data]
-        size_names = {"size_small": "Маленький", "size_medium": "Средний", "size_large": "Большой", "size_xlarge": "Очень большой"}
-        keyboard = [
-            [InlineKeyboardButton("Красный", callback_data="color_red"), InlineKeyboardButton("Белый", callback_data="color_white")],
-            [InlineKeyboardButton("Жёлтый", callback_data="color_yellow"), InlineKeyboardButton("Оранжевый", callback_data="color_orange")],
-            [InlineKeyboardButton("Синий", callback_data="color_blue"), InlineKeyboardButton("Зелёный", callback_data="color_green")],
-            [InlineKeyboardButton("Фиолетовый", callback_data="color_purple"), InlineKeyboardButton("Коричневый", callback_data="color_brown")],
-            [InlineKeyboardButton("Чёрный", callback_data="color_black"), InlineKeyboardButton("Серый", callback_data="color_gray")],
-            [InlineKeyboardButton("Розовый", callback_data="color_pink"), InlineKeyboardButton("Назад", callback_data="action_back")],
-        ]
-        await query.edit_message_text(
-            f"Размер: **{size_names[query.data]}**\n\nВыбери цвет текста:",
-            parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        return
+    sessions.messages(user_id).append(update.message.message_id)
+    if len(matches) == 1:
+        log_media_processing(user_id, "Выбран шаблон", matches[0])
+        sent = await update.message.reply_text(f"Шаблон: {matches[0]}\n\nВыбери тип:",
+                                               reply_markup=select_template(user_id, matches[0]))
+    else:
+        # callback_data не длиннее 64 байт
+        buttons = [InlineKeyboardButton(name, callback_data=f"tpl_{name}") for name in matches[:TEMPLATE_LIST_LIMIT]
+                   if len(f"tpl_{name}".encode('utf-8')) <= 64]
+        keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+        sent = await update.message.reply_text("Выбери шаблон:", reply_markup=InlineKeyboardMarkup(keyboard))
+    sessions.messages(user_id).append(sent.message_id)
 
-    # === ЦВЕТ ТЕКСТА ===
-    color_map = {
-        "color_red": "red", "color_white": "white", "color_yellow": "yellow", "color_orange": "orange",
-        "color_blue": "blue", "color_green": "green", "color_purple": "purple", "color_brown": "brown",
-        "color_black": "black", "color_gray": "gray", "color_pink": "pink",
-    }
-    color_names = {v: k.split('_')[1].capitalize() for k, v in color_map.items()}
-    if query.data in color_map:
-        user_data[user_id]['font_color'] = color_map[query.data]
-        if user_data[user_id].get('meme_type') == 'meme_demotivator':
-            keyboard = [
-                [InlineKeyboardButton("Чёрный (классика)", callback_data="bg_black"),
-                 InlineKeyboardButton("Белый", callback_data="bg_white")],
-                [InlineKeyboardButton("Тёмно-серый", callback_data="bg_dark_gray"),
-                 InlineKeyboardButton("Светло-серый", callback_data="bg_light_gray")],
-                [InlineKeyboardButton("Синий", callback_data="bg_blue"),
-                 InlineKeyboardButton("Зелёный", callback_data="bg_green")],
-                [InlineKeyboardButton("Назад", callback_data="action_back")],
-            ]
-            await query.edit_message_text(
-                f"Цвет текста: **{color_names[color_map[query.data]]}**\n\nВыбери фон:",
-                parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        else:
-            keyboard = [
-                [InlineKeyboardButton("Тонкая (4px)", callback_data="thickness_thin"),
-                 InlineKeyboardButton("Обычная (10px)", callback_data="thickness_normal")],
-                [InlineKeyboardButton("Толстая (20px)", callback_data="thickness_thick"),
-                 InlineKeyboardButton("Очень толстая (30px)", callback_data="thickness_xthick")],
-                [InlineKeyboardButton("Назад", callback_data="action_back"),
-                 InlineKeyboardButton("Отмена", callback_data="action_cancel")],
-            ]
-            await query.edit_message_text(
-                f"Цвет текста: **{color_names[color_map[query.data]]}**\n\nВыбери рамку:",
-                parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        return
 
-    # === ФОН ===
-    bg_map = {
-        "bg_black": (0, 0, 0), "bg_white": (255, 255, 255), "bg_dark_gray": (50, 50, 50),
-        "bg_light_gray": (200, 200, 200), "bg_blue": (0, 0, 139), "bg_green": (0, 100, 0),
-    }
-    bg_names = {k: v for k, v in zip(bg_map.keys(), ["Чёрный", "Белый", "Тёмно-серый", "Светло-серый", "Синий", "Зелёный"])}
-    if query.data in bg_map:
-        user_data[user_id]['bg_color'] = bg_map[query.data]
-        keyboard = [
-            [InlineKeyboardButton("Тонкая (4px)", callback_data="thickness_thin"),
-             InlineKeyboardButton("Обычная (10px)", callback_data="thickness_normal")],
-            [InlineKeyboardButton("Толстая (20px)", callback_data="thickness_thick"),
-             InlineKeyboardButton("Очень толстая (30px)", callback_data="thickness_xthick")],
-            [InlineKeyboardButton("Назад", callback_data="action_back"),
-             InlineKeyboardButton("Отмена", callback_data="action_cancel")],
-        ]
-        await query.edit_message_text(
-            f"Фон: **{bg_names[query.data]}**\n\nВыбери рамку:",
-            parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard)
-        )
+# === /size (для демотиваторов) ===
+async def size_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Вернуться к выбору размера шрифта в уже начатом демотиваторе"""
+    ud = sessions.peek(update.effective_user.id)
+    screen = wizard.jump(ud, "size") if ud else None
+    if screen is None:
+        await update.message.reply_text("Размер шрифта выбирается в демотиваторе: отправь фото и выбери «Демотиватор».")
         return
+    sent = await update.message.reply_text(screen[0], reply_markup=screen[1])
+    sessions.messages(update.effective_user.id).append(sent.message_id)
 
-    # === РАМКА ===
-    thickness_map = {"thickness_thin": 4, "thickness_normal": 10, "thickness_thick": 20, "thickness_xthick": 30}
-    if query.data in thickness_map:
-        user_data[user_id]['border_thickness'] = thickness_map[query.data]
-        await query.edit_message_text(
-            f"Рамка: **{query.data.split('_')[1].capitalize()}**\n\n"
-            "Отправь текст:\n"
-            "- 'Верхний|Нижний'\n"
-            "- 'Текст' (только снизу)",
-            parse_mode='Markdown'
-        )
-        return
 
-    # === ШРИФТЫ ===
-    font_map = {
-        "font_molodost": "Molodost.ttf", "font_roboto": "Roboto_Bold.ttf",
-        "font_times": "Times New Roman Bold Italic.ttf", "font_nougat": "Nougat Regular.ttf",
-        "font_maratype": "Maratype Regular.ttf", "font_farabee": "Farabee Bold.ttf",
-        "font_impact": "Impact.ttf", "font_anton": "Anton-Regular.ttf",
-        "font_comicsans": "Comic Sans MS.ttf", "font_arial_black": "Arial_black.ttf",
-    }
-    font_names = {k: v.split('.')[0].replace('_', ' ') for k, v in font_map.items()}
-    if query.data in font_map:
-        user_data[user_id]['font_file'] = font_map[query.data]
-        keyboard = [
-            [InlineKeyboardButton("Обычный (верх+низ)", callback_data="type_normal")],
-            [InlineKeyboardButton("Только снизу", callback_data="type_bottom_only")],
-            [InlineKeyboardButton("Назад", callback_data="action_back"),
-             InlineKeyboardButton("Отмена", callback_data="action_cancel")],
-        ]
-        await query.edit_message_text(
-            f"Шрифт: **{font_names[query.data]}**\n\nВыбери тип:",
-            parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        return
+# === КНОПКИ ===
+async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    user_id = query.from_user.id
 
-    # === ТИП МЕМА ===
-    if query.data in ["meme_classic", "meme_demotivator"]:
-        user_data[user_id]['meme_type'] = query.data
-        if user_id not in user_messages:
-            user_messages[user_id] = []
-        user_messages[user_id].append(query.message.message_id)
-
-        if query.data == "meme_classic":
-            keyboard = [
-                [InlineKeyboardButton("Impact", callback_data="classic_font_impact")],
-                [InlineKeyboardButton("Lobster", callback_data="classic_font_lobster")],
-                [InlineKeyboardButton("Назад", callback_data="action_back"),
-                 InlineKeyboardButton("Отмена", callback_data="action_cancel")],
-            ]
-            await query.edit_message_text("Выбран: **Классический мем**\n\nШрифт:", parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
-        else:
-            await query.edit_message_text("Выбран: **Демотиватор**\n\nШрифт:", parse_mode='Markdown', reply_markup=show_font_selection(user_id))
-        return
+    ud = sessions.get(user_id)
 
-    # === КЛАССИЧЕСКИЙ ШРИФТ ===
-    if query.data in ["classic_font_impact", "classic_font_lobster"]:
-        fmap = {"classic_font_impact": "Impact.ttf", "classic_font_lobster": "Lobster.ttf"}
-        user_data[user_id]['classic_font'] = fmap[query.data]
-        keyboard = [
-            [InlineKeyboardButton("Верх+низ", callback_data="classic_type_normal")],
-            [InlineKeyboardButton("Только низ", callback_data="classic_type_bottom_only")],
-            [InlineKeyboardButton("Назад", callback_data="action_back"),
-             InlineKeyboardButton("Отмена", callback_data="action_cancel")],
-        ]
-        await query.edit_message_text(f"Шрифт: **{query.data.split('_')[-1].capitalize()}**\n\nТип:", parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+    # === ОТМЕНА ===
+    if query.data == wizard.CANCEL:
+        # Сообщение с кнопками оставляем — в нём будет текст об отмене
+        ids = [m for m in sessions.take_messages(user_id) if m != query.message.message_id]
+        sessions.reset(user_id)
+        await query.edit_message_text("Генерация отменена. Прикрепи новое фото! :)")
+        cleaner.schedule(query.message.chat.id, ids)
         return
 
-    # === ТИП КЛАССИЧЕСКОГО ===
-    if query.data in ["classic_type_normal", "classic_type_bottom_only"]:
-        user_data[user_id]['classic_type'] = query.data
-        if 'caption_top' in user_data[user_id]:
-            # Обработка с подписью
-            pass  # (логика в handle_text)
-        else:
-            instr = "Текст: 'Верхний|Нижний'" if query.data == "classic_type_normal" else "Текст (только снизу)"
-            await query.edit_message_text(f"Тип: **{'Верх+низ' if 'normal' in query.data else 'Только низ'}**\n\n{instr}", parse_mode='Markdown')
+    # === НАЗАД: ровно на один шаг ===
+    if query.data == wizard.BACK:
+        screen = wizard.back(ud)
+        if screen is not None:
+            await query.edit_message_text(screen[0], reply_markup=screen[1])
         return
 
-    # === ТИП ДЕМОТИВАТОРА ===
-    if query.data in ["type_normal", "type_bottom_only"]:
-        user_data[user_id]['demotivator_type'] = query.data
-        keyboard = [
-            [InlineKeyboardButton("Маленький", callback_data="size_small"),
-             InlineKeyboardButton("Средний", callback_data="size_medium")],
-            [InlineKeyboardButton("Большой", callback_data="size_large"),
-             InlineKeyboardButton("Очень большой", callback_data="size_xlarge")],
-            [InlineKeyboardButton("Назад", callback_data="action_back"),
-             InlineKeyboardButton("Отмена", callback_data="action_cancel")],
-        ]
-        await query.edit_message_text("Тип: **{'Обычный' if 'normal' in query.data else 'Только снизу'}**\n\nРазмер:", parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+    # === ШАГИ МАСТЕРА (таблица wizard.DISPATCH) ===
+    if query.data in wizard.DISPATCH:
+        if 'photo_sizes' not in ud and 'animation' not in ud and 'template' not in ud:
+            await query.edit_message_text("Сначала отправь фото.")
+            return
+        screen = wizard.choose(ud, query.data)
+        if screen is None:
+            return  # кнопка не текущего шага (старое сообщение) — состояние не меняем
+        if query.data in wizard.FLOWS:
+            sessions.messages(user_id).append(query.message.message_id)
+        await query.edit_message_text(screen[0], parse_mode='Markdown', reply_markup=screen[1])
         return
 
-    # === ШАКАЛИЗАЦИЯ ===
-    if query.data == "shakalize_menu":
-        keyboard = [
-            [InlineKeyboardButton("Мягкая", callback_data="shakalize_mild"),
-             InlineKeyboardButton("Лёгкая", callback_data="shakalize_light")],
-            [InlineKeyboardButton("Средняя", callback_data="shakalize_medium"),
-             InlineKeyboardButton("Жёсткая", callback_data="shakalize_hard")],
-            [InlineKeyboardButton("Экстремальная", callback_data="shakalize_extreme")],
-            [InlineKeyboardButton("Назад", callback_data="action_back"),
-             InlineKeyboardButton("Отмена", callback_data="action_cancel")],
-        ]
-        await query.edit_message_text("Выбери уровень шакализации:", reply_markup=InlineKeyboardMarkup(keyboard))
+    # === ШАБЛОН ИЗ БИБЛИОТЕКИ ===
+    if query.data.startswith("tpl_"):
+        name = query.data[len("tpl_"):]
+        if name not in template_registry.names():
+            await query.edit_message_text("Шаблон не найден.")
+            return
+        await query.edit_message_text(f"Шаблон: {name}\n\nВыбери тип:", reply_markup=select_template(user_id, name))
         return
 
-    if query.data.startswith("shakalize_") and query.data != "shakalize_menu":
+    # === ШАКАЛИЗАЦИЯ: уровень или превью всех уровней ===
+    if query.data.startswith("shakalize_"):
         level = query.data.split('_')[-1]
         if level == "glitch":
             await query.edit_message_text("Глитч удалён.")
             return
+        # Кнопки могут быть и под превью (фото) — там текст не отредактировать, отвечаем новым сообщением
+        notify = query.message.reply_text if query.message.photo else query.edit_message_text
         try:
-            if 'photo' not in user_data[user_id]:
-                await query.edit_message_text("Сначала отправь фото.")
+            if 'photo_sizes' not in ud:
+                await notify("Сначала отправь фото.")
                 return
-            photo_bytes = user_data[user_id]['photo']
-            photo_bytes.seek(0)
-            result = shakalize_image(photo_bytes, intensity=level)
-            await query.message.reply_photo(photo=result, caption="Зашакалил!")
-            if user_id in user_messages:
-                for msg_id in user_messages[user_id]:
-                    try:
-                        await context.bot.delete_message(chat_id=query.message.chat.id, message_id=msg_id)
-                    except:
-                        pass
-                user_messages[user_id] = []
-            user_data[user_id].pop('photo', None)
+            if not await admit(user_id, query.message.chat, query.message.reply_text, render=True):
+                return
+            if level == "preview":
+                # Все уровни одной картинкой; фото остаётся в сессии до выбора уровня
+                sent = await render_and_reply(context, user_id, query.message, "shakalize_sheet",
+                                              "Выбери уровень:", reply_markup=wizard.SHAKALIZE_LEVELS)
+                sessions.messages(user_id).append(sent.message_id)
+                return
+            await render_and_reply(context, user_id, query.message, "shakalize", "Зашакалил!", intensity=level)
+            cleaner.schedule(query.message.chat.id, sessions.take_messages(user_id))
+            sessions.pop_photo(user_id)
+            for key in ['photo_sizes', 'album', 'preview_message_id', 'step']:
+                ud.pop(key, None)
+        except RenderTimeout as e:
+            log_error(user_id, f"Таймаут шакализации: {e}")
+            await notify("Слишком долго. Попробуй позже.")
+        except RenderBusy as e:
+            admission.reject("busy")
+            log_error(user_id, f"Очередь рендера заполнена: {e}")
+            await notify(BUSY_TEXT)
+        except ImageTooLarge as e:
+            log_error(user_id, f"Картинка слишком большая: {e}")
+            await notify("Картинка слишком большая.")
         except Exception as e:
             logger.error(f"Шакализация error: {e}", exc_info=True)
-            await query.edit_message_text("Ошибка.")
+            await notify("Ошибка.")
         return
 
 
-def show_font_selection(user_id: int) -> InlineKeyboardMarkup:
-    keyboard = [
-        [InlineKeyboardButton("Molodost", callback_data="font_molodost")],
-        [InlineKeyboardButton("Roboto Bold", callback_data="font_roboto")],
-        [InlineKeyboardButton("Times New Roman", callback_data="font_times")],
-        [InlineKeyboardButton("Nougat", callback_data="font_nougat")],
-        [InlineKeyboardButton("Maratype", callback_data="font_maratype")],
-        [InlineKeyboardButton("Farabee Bold", callback_data="font_farabee")],
-        [InlineKeyboardButton("Impact", callback_data="font_impact"),
-         InlineKeyboardButton("Anton", callback_data="font_anton")],
-        [InlineKeyboardButton("Comic Sans", callback_data="font_comicsans"),
-         InlineKeyboardButton("Arial Black", callback_data="font_arial_black")],
-        [InlineKeyboardButton("Назад", callback_data="action_back"),
-         InlineKeyboardButton("Отмена", callback_data="action_cancel")],
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-
 # === ОБРАБОТКА МЕДИА (ТОЛЬКО ФОТО) ===
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -395,92 +311,354 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     log_media_processing(user_id, "Начата обработка медиа")
 
-    # Проверяем, что это фото, игнорируем GIF и видео
+    # GIF и видео: только классический мем, рендер покадрово; из альбома — каждое отдельно,
+    # поэтому и лимит у каждого свой
     if update.message.animation or update.message.video:
-        await update.message.reply_text("GIF и видео не поддерживаются. Отправьте статическое фото.")
+        # Видео из альбома в группе фильтр пропускает ради альбома — само по себе без упоминания не берём
+        if mentions_bot(update.message) and await admit(user_id, update.message.chat, update.message.reply_text):
+            await handle_animation(update, context)
         return
 
-    photo = update.message.photo[-1]
-    file = await context.bot.get_file(photo.file_id)
-    log_media_processing(user_id, "Обработка фото")
+    # Альбом приходит отдельными апдейтами: собираем его целиком и запускаем мастер один раз;
+    # лимит проверяется для альбома целиком при сборке (start_album), а не для каждого фото
+    if update.message.media_group_id:
+        albums.add(update.message.media_group_id, update.message,
+                   lambda messages: start_album(context, user_id, messages))
+        return
+
+    if not await admit(user_id, update.message.chat, update.message.reply_text):
+        return
+
+    # Скачиваем не здесь, а при рендере: в сессии только file_id всех размеров
+    sizes = photo_sizes(update.message)
+    largest = pick_size(sizes)
+    log_media_processing(user_id, "Обработка фото", f"{largest['width']}x{largest['height']}")
 
     # Проверка размера файла (макс 50 MB)
-    if file.file_size > 50 * 1024 * 1024:
-        log_error(user_id, f"Файл слишком большой: {file.file_size} байт")
+    if (largest["file_size"] or 0) > MAX_FILE_SIZE:
+        log_error(user_id, f"Файл слишком большой: {largest['file_size']} байт")
         await update.message.reply_text("Файл слишком большой (макс 50 MB).")
         return
 
-    media_bytes = io.BytesIO()
-    await file.download_to_memory(media_bytes)
-    media_bytes.seek(0)
-
     caption = (update.message.caption or "").strip()
-    bot_username = context.bot.username.lower()
-
-    # Группа: проверка упоминания
+    # Группа: упоминание уже проверено фильтром mentioned_or_private
     if chat_type in ['group', 'supergroup']:
-        mentioned = False
-        if caption and f"@memfy_bot" in caption.lower():
-            mentioned = True
-        elif update.message.caption_entities:
-            for e in update.message.caption_entities:
-                if e.type == "mention":
-                    mention = caption[e.offset:e.offset + e.length].lower()
-                    if mention in [f"@memfy_bot", f"@{bot_username}"]:
-                        mentioned = True
-                        break
-        if not mentioned:
-            return
-        caption = caption.replace(f"@{bot_username}", "").replace("@memfy_bot", "").strip()
+        caption = strip_mentions(caption, context.bot.username)
+
+    await offer_photo(user_id, update.message, [sizes], caption, [update.message.message_id])
+
+
+async def start_album(context: ContextTypes.DEFAULT_TYPE, user_id: int, messages: list):
+    """Весь альбом — один мастер: подпись и стиль общие для всех фото.
+    Вызывается по таймеру, вне обработки апдейта — ставим в очередь апдейтов пользователя
+    (та же блокировка, загрузка и сохранение сессии)"""
+    messages.sort(key=lambda m: m.message_id)
+    # В группе фильтр пропускает все элементы альбомов: упомянуть бота должны хотя бы в одной подписи
+    if not any(mentions_bot(m) for m in messages):
+        return
+    await context.application.update_processor.run_locked(user_id, start_album_wizard(context, user_id, messages))
+
+
+async def start_album_wizard(context: ContextTypes.DEFAULT_TYPE, user_id: int, messages: list):
+    if not await admit(user_id, messages[-1].chat, messages[-1].reply_text):
+        return
+    album = [photo_sizes(m) for m in messages]
+    album = [sizes for sizes in album if (pick_size(sizes)["file_size"] or 0) <= MAX_FILE_SIZE]
+    log_media_processing(user_id, "Обработка альбома", f"{len(album)} фото")
+    if not album:
+        await messages[-1].reply_text("Файл слишком большой (макс 50 MB).")
+        return
+
+    caption = next((m.caption.strip() for m in messages if m.caption), "")
+    if messages[0].chat.type in ['group', 'supergroup']:
+        caption = strip_mentions(caption, context.bot.username)
+
+    await offer_photo(user_id, messages[-1], album, caption, [m.message_id for m in messages])
 
-    if user_id not in user_data:
-        user_data[user_id] = {}
-    user_data[user_id]['photo'] = media_bytes
+
+async def offer_photo(user_id: int, message, album: list, caption: str, message_ids: list):
+    """Новое фото (или альбом) в сессию и меню выбора действия"""
+    ud = sessions.get(user_id)
+    sessions.pop_photo(user_id)
+    for key in ['animation', 'album', 'template']:
+        ud.pop(key, None)
+    # Мастер и превью работают с первым фото; album — все фото для итогового рендера
+    ud['photo_sizes'] = album[0]
+    if len(album) > 1:
+        ud['album'] = album
 
     if caption and '|' in caption:
         texts = caption.split('|', 1)
-        user_data[user_id]['caption_top'] = texts[0].strip()
-        user_data[user_id]['caption_bottom'] = texts[1].strip() if len(texts) > 1 else ""
-
-    if user_id not in user_messages:
-        user_messages[user_id] = []
-    user_messages[user_id].append(update.message.message_id)
-
-    keyboard = [
-        [InlineKeyboardButton("Классический мем", callback_data="meme_classic")],
-        [InlineKeyboardButton("Демотиватор", callback_data="meme_demotivator")],
-        [InlineKeyboardButton("Зашакалить", callback_data="shakalize_menu")],
-    ]
+        ud['caption_top'] = texts[0].strip()
+        ud['caption_bottom'] = texts[1].strip() if len(texts) > 1 else ""
+
+    sessions.messages(user_id).extend(message_ids)
+
+    received = f"Альбом получен ({len(album)} фото)!" if len(album) > 1 else "Фото получено!"
+    sent = await message.reply_text(
+        f"{received}\n\nВыбери действие:",
+        reply_markup=wizard.start(ud)
+    )
+    sessions.messages(user_id).append(sent.message_id)
+
+
+async def handle_animation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    ref = animation_ref(update.message)
+    log_media_processing(user_id, "Обработка GIF/видео", f"{ref['width']}x{ref['height']}, {ref['duration']}с")
+
+    if (ref["file_size"] or 0) > MAX_FILE_SIZE:
+        log_error(user_id, f"Файл слишком большой: {ref['file_size']} байт")
+        await update.message.reply_text("Файл слишком большой (макс 50 MB).")
+        return
+
+    caption = (update.message.caption or "").strip()
+    if update.message.chat.type in ['group', 'supergroup']:
+        caption = strip_mentions(caption, context.bot.username)
+
+    ud = sessions.get(user_id)
+    sessions.pop_photo(user_id)
+    for key in ['photo_sizes', 'album', 'template']:
+        ud.pop(key, None)
+    ud['animation'] = ref
+
+    if caption and '|' in caption:
+        texts = caption.split('|', 1)
+        ud['caption_top'] = texts[0].strip()
+        ud['caption_bottom'] = texts[1].strip() if len(texts) > 1 else ""
+
+    sessions.messages(user_id).append(update.message.message_id)
+
     sent = await update.message.reply_text(
-        "Фото получено!\n\nВыбери действие:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        "GIF/видео получено!\n\nВыбери действие:",
+        reply_markup=wizard.start(ud)
     )
-    user_messages[user_id].append(sent.message_id)
+    sessions.messages(user_id).append(sent.message_id)
+
+
+# === ЗАГРУЗКА ФОТО ПРИ РЕНДЕРЕ ===
+async def load_photo(context: ContextTypes.DEFAULT_TYPE, user_id: int, size: dict) -> bytes:
+    """Байты фото для рендера: из сессии (если уже скачаны) или скачиваем нужный размер"""
+    data = sessions.get_photo(user_id, size['file_unique_id'])
+    if data is not None:
+        return data
+    data = await download(context.bot, size)
+    log_media_processing(user_id, "Фото скачано", f"{size['width']}x{size['height']}, {len(data)} байт")
+    # Кэшируем на случай повтора после ошибки/таймаута
+    sessions.set_photo(user_id, data, size['file_unique_id'])
+    return data
+
+
+# === РЕНДЕР С КЭШЕМ РЕЗУЛЬТАТОВ ===
+async def render_and_reply(context: ContextTypes.DEFAULT_TYPE, user_id: int, message, engine: str,
+                           caption: str, reply_markup=None, **params):
+    """Отвечает на message готовым фото: из кэша по file_id или после скачивания и рендера.
+    Возвращает отправленное сообщение."""
+    ud = sessions.get(user_id)
+    if ud.get('album') and engine in ALBUM_ENGINES:
+        return await render_album_and_reply(context, user_id, message, engine, caption, **params)
+    animated = engine == "animated"
+    metrics.set_request_labels(renderer=engine, chat_type=message.chat.type)
+    template = ud.get('template')
+    if template:
+        # Шаблон из memes/ уже в памяти воркеров — скачивать нечего
+        params['template'] = template
+        source_id = template_registry.digest(template)
+    elif animated:
+        source_id = ud['animation']['file_unique_id']
+    else:
+        size = pick_size(ud['photo_sizes'], RENDER_TARGETS.get(engine))
+        source_id = size['file_unique_id']
+    sticker = params.get('output') == "sticker"
+    if animated:
+        send = message.reply_animation
+    elif sticker:
+        # У стикера нет подписи — только кнопки
+        send = lambda media, caption=None, **kwargs: message.reply_sticker(media, **kwargs)
+    else:
+        send = message.reply_photo
+    key = cache_key(source_id, engine, params)
+    file_id = result_cache.get(key)
+    if file_id is not None:
+        try:
+            with metrics.stage("upload_cached"):
+                sent = await send(file_id, caption=caption, reply_markup=reply_markup)
+            log_media_processing(user_id, "Результат из кэша", engine)
+            return sent
+        except BadRequest as e:
+            log_error(user_id, f"file_id из кэша не принят: {e}")
+            result_cache.discard(key)
+
+    if template:
+        media_bytes = b""
+    else:
+        media_bytes = await load_photo(context, user_id, ud['animation'] if animated else size)
+    if animated:
+        result = await render_pool.submit(engine, media_bytes, timeout=config.ANIMATION_TIMEOUT, **params)
+        filename = "meme.gif" if result[:3] == b'GIF' else "meme.mp4"
+        with metrics.stage("upload"):
+            sent = await send(result, caption=caption, filename=filename, reply_markup=reply_markup)
+        sent_file = sent.animation or sent.document
+    else:
+        result = await render_pool.submit(engine, media_bytes, **params)
+        with metrics.stage("upload"):
+            sent = await send(result, caption=caption, reply_markup=reply_markup)
+        sent_file = sent.sticker if sticker else (sent.photo[-1] if sent.photo else None)
+    if sent_file:
+        result_cache.put(key, sent_file.file_id)
+    return sent
+
+
+async def gather_or_cancel(*aws) -> list:
+    """asyncio.gather, но первая ошибка отменяет остальные: альбом всё равно не уйдёт,
+    а рендеры, ещё ждущие в очереди пула, снимаются и не занимают воркеры"""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()  # завершённым — без эффекта
+
+
+async def render_album_and_reply(context: ContextTypes.DEFAULT_TYPE, user_id: int, message, engine: str,
+                                 caption: str, **params):
+    """Альбом: все фото рендерятся параллельно в пуле и уходят одним sendMediaGroup.
+    Возвращает первое сообщение альбома."""
+    ud = sessions.get(user_id)
+    metrics.set_request_labels(renderer=engine, chat_type=message.chat.type)
+    if params.get('output') == "sticker":
+        params['output'] = "jpeg"  # стикер в альбом не положить
+    sizes = [pick_size(s, RENDER_TARGETS.get(engine)) for s in ud['album']]
+    keys = [cache_key(size['file_unique_id'], engine, params) for size in sizes]
+
+    async def render(size: dict, key: str, use_cache: bool):
+        file_id = result_cache.get(key) if use_cache else None
+        if file_id is not None:
+            return file_id
+        data = await download(context.bot, size)
+        return await render_pool.submit(engine, data, **params)
+
+    for use_cache in (True, False):
+        media = await gather_or_cancel(*(render(size, key, use_cache) for size, key in zip(sizes, keys)))
+        try:
+            with metrics.stage("upload"):
+                sent = await message.reply_media_group(
+                    [InputMediaPhoto(m, caption=caption if i == 0 else None) for i, m in enumerate(media)]
+                )
+            break
+        except BadRequest as e:
+            if not use_cache or all(isinstance(m, bytes) for m in media):
+                raise
+            # Один устаревший file_id ломает весь альбом — перерендериваем без кэша
+            log_error(user_id, f"file_id из кэша не принят: {e}")
+            for key in keys:
+                result_cache.discard(key)
+
+    for key, m, msg in zip(keys, media, sent):
+        if isinstance(m, bytes) and msg.photo:
+            result_cache.put(key, msg.photo[-1].file_id)
+    log_media_processing(user_id, "Альбом отправлен", f"{engine}, {len(sent)} фото")
+    return sent[0]
+
+
+# === ПРЕВЬЮ В МАСТЕРЕ ===
+# После каждого выбора стиля (шаги wizard.FLOW_STEPS и «Назад») — маленькое превью с текстом-заглушкой
+
+
+def preview_request(ud: dict, full_width: int) -> tuple:
+    """Рендер и параметры превью — те же, что у итогового рендера в handle_text"""
+    top, bottom = ud.get('caption_top') or "Верхний текст", ud.get('caption_bottom') or "Нижний текст"
+    if ud['meme_type'] == 'meme_classic':
+        if ud.get('classic_type') == 'classic_type_bottom_only':
+            top = ""
+        # Минимальный шрифт в масштабе превью, чтобы пропорции совпали с итоговым мемом
+        min_font = max(8, 40 * config.PREVIEW_SIDE // max(full_width, config.PREVIEW_SIDE))
+        return "classic", dict(top_text=top, bottom_text=bottom,
+                               font_key=ud.get('classic_font', 'impact'), min_font_size=min_font)
+    dtype = ud.get('demotivator_type', 'type_normal')
+    return "demotivator", dict(
+        top_text="" if dtype == 'type_bottom_only' else top, bottom_text=bottom,
+        font_size=ud.get('font_size'), font_key=ud.get('font_key', 'roboto'), demotivator_type=dtype,
+        font_color=ud.get('font_color', 'white'), border_thickness=ud.get('border_thickness', 10),
+        bg_color=ud.get('bg_color', (0, 0, 0)),
+    )
+
+
+async def update_preview(context: ContextTypes.DEFAULT_TYPE, query, user_id: int):
+    ud = sessions.peek(user_id)
+    if not ud or ('photo_sizes' not in ud and 'template' not in ud) or \
+            ud.get('meme_type') not in ('meme_classic', 'meme_demotivator'):
+        return
+    if 'template' in ud:
+        # Шаблон уже в памяти воркеров и сам маленький: превью рисуется прямо на нём
+        engine, params = preview_request(ud, config.PREVIEW_SIDE)
+        params['template'] = ud['template']
+        source = b""
+    else:
+        engine, params = preview_request(ud, pick_size(ud['photo_sizes'], RENDER_TARGETS['classic'])['width'])
+        # Самый маленький размер фото, покрывающий превью: скачивается быстро, хранится в сессии
+        size = pick_size(ud['photo_sizes'], (config.PREVIEW_SIDE, config.PREVIEW_SIDE))
+        source = sessions.get_thumb(user_id, size['file_unique_id'])
+        if source is None:
+            thumb_source = await download(context.bot, size)
+            source = await render_pool.submit("thumbnail", thumb_source, side=config.PREVIEW_SIDE)
+            sessions.set_thumb(user_id, source, size['file_unique_id'])
+    metrics.set_request_labels(renderer=f"{engine}_preview", chat_type=query.message.chat.type)
+    preview = await render_pool.submit(engine, source, **params)
+
+    message_id = ud.get('preview_message_id')
+    if message_id:
+        try:
+            with metrics.stage("upload"):
+                await context.bot.edit_message_media(
+                    media=InputMediaPhoto(preview, caption="Превью"),
+                    chat_id=query.message.chat.id, message_id=message_id,
+                )
+            return
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return
+            log_error(user_id, f"Превью не обновилось: {e}")
+    with metrics.stage("upload"):
+        sent = await query.message.reply_photo(preview, caption="Превью")
+    ud['preview_message_id'] = sent.message_id
+    sessions.messages(user_id).append(sent.message_id)
+
+
+async def wizard_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    step = wizard.route(update.callback_query.data)
+    with metrics.wizard_step(step):
+        await button_callback(update, context)
+    if config.WIZARD_PREVIEW and (step in wizard.FLOW_STEPS or step == "back"):
+        try:
+            await update_preview(context, update.callback_query, update.callback_query.from_user.id)
+        except Exception as e:
+            # Превью — необязательная подсказка, мастер работает и без него
+            logger.warning(f"Превью не удалось: {e}")
 
 
 # === ОБРАБОТКА ТЕКСТА ===
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if user_id not in user_data or 'photo' not in user_data[user_id]:
+    ud = sessions.peek(user_id)
+    if not ud or ('photo_sizes' not in ud and 'animation' not in ud and 'template' not in ud):
         if update.message.chat.type == 'private':
             await update.message.reply_text("Сначала отправь фото/гиф/видео.")
         return
 
-    meme_type = user_data[user_id].get('meme_type')
+    meme_type = ud.get('meme_type')
     if not meme_type:
         await update.message.reply_text("Сначала выбери тип мема.")
         return
 
     text = update.message.text.strip()
-    media_bytes = user_data[user_id]['photo']
-    media_bytes.seek(0)
 
     try:
         if meme_type == 'meme_classic':
-            if 'classic_font' not in user_data[user_id]:
+            if 'classic_font' not in ud:
                 await update.message.reply_text("Выбери шрифт.")
                 return
-            ctype = user_data[user_id].get('classic_type', 'classic_type_normal')
+            ctype = ud.get('classic_type', 'classic_type_normal')
             if ctype == 'classic_type_bottom_only':
                 top, bottom = "", text
             else:
@@ -489,25 +667,29 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     return
                 top, bottom = [t.strip() for t in text.split('|', 1)]
 
-            if user_id in user_messages:
-                for msg_id in user_messages[user_id]:
-                    try:
-                        await context.bot.delete_message(chat_id=update.message.chat.id, message_id=msg_id)
-                    except:
-                        pass
-                user_messages[user_id] = []
+            font = ud['classic_font']
+            if not await admit(user_id, update.message.chat, update.message.reply_text, render=True):
+                return
 
-            font = user_data[user_id]['classic_font']
+            if 'animation' in ud:
+                log_media_processing(user_id, "Создание классического мема для GIF/видео")
+                await render_and_reply(context, user_id, update.message, "animated", "Готово!",
+                                       top_text=top, bottom_text=bottom, font_key=font)
+            else:
+                log_media_processing(user_id, "Создание классического мема для фото")
+                await render_and_reply(context, user_id, update.message, "classic", "Готово!",
+                                       top_text=top, bottom_text=bottom, font_key=font,
+                                       output=config.OUTPUT_FORMAT)
 
-            log_media_processing(user_id, "Создание классического мема для фото")
-            meme = create_classic_meme(media_bytes, top, bottom, font)
-            await update.message.reply_photo(photo=meme, caption="Готово!")
+        elif 'animation' in ud:
+            await update.message.reply_text("Для GIF/видео доступен только классический мем.")
+            return
 
         else:  # демотиватор (только для фото)
-            if 'font_file' not in user_data[user_id]:
+            if 'font_key' not in ud:
                 await update.message.reply_text("Выбери шрифт.")
                 return
-            dtype = user_data[user_id].get('demotivator_type', 'type_normal')
+            dtype = ud.get('demotivator_type', 'type_normal')
             if dtype == 'type_bottom_only':
                 top, bottom = "", text
             else:
@@ -516,266 +698,216 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     return
                 top, bottom = [t.strip() for t in text.split('|', 1)]
 
-            if user_id in user_messages:
-                for msg_id in user_messages[user_id]:
-                    try:
-                        await context.bot.delete_message(chat_id=update.message.chat.id, message_id=msg_id)
-                    except:
-                        pass
-                user_messages[user_id] = []
-
-            demotivator = create_demotivator(
-                media_bytes, top, bottom,
-                font_size=user_data[user_id].get('font_size'),
-                font_file=user_data[user_id]['font_file'],
+            if not await admit(user_id, update.message.chat, update.message.reply_text, render=True):
+                return
+            await render_and_reply(
+                context, user_id, update.message, "demotivator", "Демотиватор готов!",
+                top_text=top, bottom_text=bottom,
+                font_size=ud.get('font_size'),
+                font_key=ud['font_key'],
                 demotivator_type=dtype,
-                font_color=user_data[user_id].get('font_color', 'white'),
-                border_thickness=user_data[user_id].get('border_thickness', 10),
-                bg_color=user_data[user_id].get('bg_color', (0, 0, 0))
+                font_color=ud.get('font_color', 'white'),
+                border_thickness=ud.get('border_thickness', 10),
+                bg_color=ud.get('bg_color', (0, 0, 0)),
+                output=config.OUTPUT_FORMAT
             )
-            await update.message.reply_photo(photo=demotivator, caption="Демотиватор готов!")
-
-        # Очистка
-        for key in ['photo', 'meme_type', 'classic_font', 'classic_type',
-                    'font_file', 'font_size', 'font_color', 'bg_color', 'border_thickness', 'demotivator_type']:
-            user_data[user_id].pop(key, None)
 
+        # Очистка: сначала ушёл ответ, служебные сообщения удаляются в фоне
+        cleaner.schedule(update.message.chat.id, sessions.take_messages(user_id))
+        sessions.pop_photo(user_id)
+        for key in ['photo_sizes', 'album', 'animation', 'template', 'preview_message_id', 'step', 'meme_type', 'classic_font', 'classic_type',
+                    'font_key', 'font_size', 'font_color', 'bg_color', 'border_thickness', 'demotivator_type']:
+            ud.pop(key, None)
+
+    except RenderTimeout as e:
+        log_error(user_id, f"Таймаут рендера: {e}")
+        await update.message.reply_text("Слишком долго. Попробуй позже.")
+    except RenderBusy as e:
+        admission.reject("busy")
+        log_error(user_id, f"Очередь рендера заполнена: {e}")
+        await update.message.reply_text(BUSY_TEXT)
+    except ImageTooLarge as e:
+        log_error(user_id, f"Картинка слишком большая: {e}")
+        await update.message.reply_text("Картинка слишком большая.")
     except Exception as e:
         logger.error(f"Ошибка в handle_text: {e}", exc_info=True)
         await update.message.reply_text("Ошибка. Попробуй снова.")
 
 
-# === КЛАССИЧЕСКИЙ МЕМ (для фото) ===
-def create_classic_meme(photo_bytes: io.BytesIO, top_text: str, bottom_text: str, font_file: str = "Impact.ttf") -> io.BytesIO:
-    image = Image.open(photo_bytes).convert('RGB')
-    w, h = image.size
-    font_size = max(40, int(w / 20))
-    font_paths = [os.path.join(FONT_DIR, font_file), font_file]
-    font = ImageFont.load_default()
-    for path in font_paths:
-        try:
-            font = ImageFont.truetype(path, font_size)
-            break
-        except:
-            continue
-
-    draw = ImageDraw.Draw(image)
-
-    def draw_outline(text, pos, fill=(255, 255, 255), outline=(0, 0, 0), width=2):
-        x, y = pos
-        for adj in range(-width, width + 1):
-            for adj2 in range(-width, width + 1):
-                if adj or adj2:
-                    draw.text((x + adj, y + adj2), text, font=font, fill=outline)
-        draw.text(pos, text, font=font, fill=fill)
-
-    def wrap(text, max_w):
-        words = text.split()
-        lines = []
-        line = []
-        for word in words:
-            test = ' '.join(line + [word])
-            if draw.textbbox((0, 0), test, font=font)[2] <= max_w:
-                line.append(word)
-            else:
-                lines.append(' '.join(line))
-                line = [word]
-        if line:
-            lines.append(' '.join(line))
-        return lines
-
-    if top_text:
-        lines = wrap(top_text, w - 40)
-        y = 10
-        for line in lines:
-            tw = draw.textbbox((0, 0), line, font=font)[2]
-            draw_outline(line, ((w - tw) // 2, y))
-            y += int(font_size * 1.3)
-
-    if bottom_text:
-        lines = wrap(bottom_text, w - 40)
-        y = h - len(lines) * int(font_size * 1.3) - 10
-        for line in lines:
-            tw = draw.textbbox((0, 0), line, font=font)[2]
-            draw_outline(line, ((w - tw) // 2, y))
-            y += int(font_size * 1.3)
-
-    # Водяной знак
-    wm_text = "@memfy_bot"
-    wm_font_path = os.path.join(FONT_DIR, "Roboto_Bold.ttf")
-    try:
-        wm_font = ImageFont.truetype(wm_font_path, 16) if os.path.exists(wm_font_path) else ImageFont.load_default()
-    except:
-        wm_font = ImageFont.load_default()
-    tw, th = draw.textbbox((0, 0), wm_text, font=wm_font)[2:]
-    wm_img = Image.new('RGBA', (tw + 10, th + 5), (0, 0, 0, 0))
-    wm_draw = ImageDraw.Draw(wm_img)
-    wm_draw.text((5, 0), wm_text, fill=(255, 255, 255, 128), font=wm_font)
-    corners = [(10, 10), (w - tw - 20, 10), (10, h - th - 20), (w - tw - 20, h - th - 20)]
-    image.paste(wm_img, random.choice(corners), wm_img)
-
-    out = io.BytesIO()
-    image.save(out, format='JPEG', quality=95)
-    out.seek(0)
-    return out
-
-
-# === ДЕМОТИВАТОР (с адаптивной обводкой и водяным знаком) ===
-def create_demotivator(photo_bytes: io.BytesIO, top_text: str, bottom_text: str,
-                      font_size: dict = None, font_file: str = "Roboto_Bold.ttf",
-                      demotivator_type: str = "type_normal", font_color: str = "white",
-                      border_thickness: int = 10, bg_color: tuple = (0, 0, 0)) -> io.BytesIO:
-    if font_size is None:
-        font_size = {"top": 40, "bottom": 28}
-    top_fs, bottom_fs = font_size["top"], font_size["bottom"]
-
-    color_map = {
-        "red": (255, 0, 0), "white": (255, 255, 255), "yellow": (255, 255, 0), "orange": (255, 165, 0),
-        "blue": (0, 0, 255), "green": (0, 255, 0), "purple": (128, 0, 128), "brown": (165, 42, 42),
-        "black": (0, 0, 0), "gray": (128, 128, 128), "pink": (255, 192, 203),
-    }
-    text_color = color_map.get(font_color, (255, 255, 255))
-
-    # Адаптивные цвета
-    is_black_bg = bg_color == (0, 0, 0)
-    border_color = (255, 255, 255) if is_black_bg else (100, 100, 100)
-    watermark_color = (255, 255, 255, 180) if is_black_bg else (50, 50, 50, 180)
-
-    image = Image.open(photo_bytes).convert('RGB')
-    STANDARD = 512
-    if image.size != (STANDARD, STANDARD):
-        image = image.resize((STANDARD, STANDARD), Image.Resampling.LANCZOS)
-    w, h = STANDARD, STANDARD
-
-    padding = 30
-    total_pad = padding + border_thickness
-    top_space = 80 if demotivator_type == "type_normal" else 20
-    dw = w + total_pad * 2
-    dh = h + total_pad * 2 + (200 if demotivator_type == "type_normal" else 120)
-
-    canvas = Image.new('RGB', (dw, dh), bg_color)
-    canvas.paste(image, (total_pad, total_pad + top_space))
-    draw = ImageDraw.Draw(canvas)
-
-    # Рамка
-    x1, y1 = total_pad - border_thickness, total_pad + top_space - border_thickness
-    x2, y2 = total_pad + w + border_thickness - 1, total_pad + h + top_space + border_thickness - 1
-    for i in range(border_thickness):
-        draw.rectangle([x1 - i, y1 - i, x2 + i, y2 + i], outline=border_color, width=1)
-
-    # Шрифты
-    font_paths = [os.path.join(FONT_DIR, font_file), font_file]
-    font_large = font_small = ImageFont.load_default()
-    for path in font_paths:
-        try:
-            font_large = ImageFont.truetype(path, top_fs)
-            font_small = ImageFont.truetype(path, bottom_fs)
-            break
-        except:
-            continue
-
-    def wrap(text, font, max_w):
-        words = text.split()
-        lines = []
-        line = []
-        for word in words:
-            test = ' '.join(line + [word])
-            if draw.textbbox((0, 0), test, font=font)[2] <= max_w:
-                line.append(word)
-            else:
-                lines.append(' '.join(line))
-                line = [word]
-        if line:
-            lines.append(' '.join(line))
-        return lines
-
-    # Текст
-    if top_text and demotivator_type == "type_normal":
-        lines = wrap(top_text, font_large, dw - 100)
-        y = 20
-        for line in lines:
-            tw = draw.textbbox((0, 0), line, font=font_large)[2]
-            draw.text(((dw - tw) // 2, y), line, fill=text_color, font=font_large)
-            y += int(top_fs * 1.25)
-
-    if bottom_text:
-        lines = wrap(bottom_text, font_small, dw - 100)
-        y = total_pad + h + top_space + border_thickness + 30
-        for line in lines:
-            tw = draw.textbbox((0, 0), line, font=font_small)[2]
-            draw.text(((dw - tw) // 2, y), line, fill=text_color, font=font_small)
-            y += int(bottom_fs * 1.25)
-
-    # Водяной знак
-    wm_text = "@memfy_bot"
-    wm_font_path = os.path.join(FONT_DIR, "Roboto_Bold.ttf")
-    try:
-        wm_font = ImageFont.truetype(wm_font_path, 16) if os.path.exists(wm_font_path) else ImageFont.load_default()
-    except:
-        wm_font = ImageFont.load_default()
-    tw, th = draw.textbbox((0, 0), wm_text, font=wm_font)[2:]
-    wm_img = Image.new('RGBA', (tw + 10, th + 5), (0, 0, 0, 0))
-    wm_draw = ImageDraw.Draw(wm_img)
-    wm_draw.text((5, 0), wm_text, fill=watermark_color, font=wm_font)
-    corners = [(15, 15), (dw - tw - 25, 15), (15, dh - th - 25), (dw - tw - 25, dh - th - 25)]
-    canvas.paste(wm_img, random.choice(corners), wm_img)
-
-    out = io.BytesIO()
-    canvas.save(out, format='JPEG', quality=95)
-    out.seek(0)
-    return out
-
-
-# === ШАКАЛИЗАЦИЯ (без глитча) ===
-def shakalize_image(photo_bytes: io.BytesIO, intensity: str = 'hard') -> io.BytesIO:
+# === ИНЛАЙН-РЕЖИМ ===
+async def upload_inline(bot, images: list) -> list:
+    """Загружает картинки в INLINE_CHAT_ID ради file_id: до 10 штук одним sendMediaGroup"""
+    async def send(chunk: list) -> list:
+        if len(chunk) == 1:
+            return [await bot.send_photo(config.INLINE_CHAT_ID, chunk[0], disable_notification=True)]
+        return await bot.send_media_group(config.INLINE_CHAT_ID, [InputMediaPhoto(m) for m in chunk],
+                                          disable_notification=True)
+
+    chunks = [images[i:i + ALBUM_LIMIT] for i in range(0, len(images), ALBUM_LIMIT)]
+    with metrics.stage("upload"):
+        sent = await asyncio.gather(*(send(chunk) for chunk in chunks))
+    return [message for chunk in sent for message in chunk]
+
+
+async def answer_inline(query, results: list, cache_time: float):
     try:
-        im = Image.open(photo_bytes).convert('RGB')
-        levels = {
-            'mild': (0.8, 6, 50), 'light': (0.6, 5, 35), 'medium': (0.35, 4, 20),
-            'hard': (0.14, 3, 8), 'extreme': (0.05, 2, 5),
-        }
-        down, bits, qual = levels.get(intensity, levels['hard'])
-        w, h = im.size
-        nw, nh = max(2, int(w * down)), max(2, int(h * down))
-        small = im.resize((nw, nh), Image.Resampling.NEAREST)
-        pixel = small.resize((w, h), Image.Resampling.NEAREST)
-        poster = ImageOps.posterize(pixel, bits)
-        blur = poster.filter(ImageFilter.GaussianBlur(1))
-        final = ImageOps.autocontrast(blur)
-        out = io.BytesIO()
-        final.save(out, format='JPEG', quality=qual)
-        final = Image.open(out).convert('P', palette=Image.ADAPTIVE, colors=64).convert('RGB')
-        final_out = io.BytesIO()
-        final.save(final_out, format='JPEG', quality=max(2, qual))
-        final_out.seek(0)
-        return final_out
-    except Exception as e:
-        logger.error(f"Ошибка в shakalize_image: {e}", exc_info=True)
-        # Возвращаем оригинал в случае ошибки
-        photo_bytes.seek(0)
-        return photo_bytes
+        await query.answer(results, cache_time=int(cache_time))
+    except TelegramError as e:
+        # Запрос устарел, пока шёл рендер: file_id уже в кэше, повторный запрос ответится сразу
+        logger.warning(f"Инлайн-ответ не принят: {e}")
 
 
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """@memfy_bot верх|низ — мемы на шаблонах из memes/.
 
+    Готовые file_id берутся из кэша результатов, недостающие мемы рендерятся параллельно
+    на шаблонах из памяти и загружаются разом; ответ на тот же запрос помнится INLINE_CACHE_TTL.
+    Рендер — только для запроса, после которого INLINE_DEBOUNCE не пришло более нового,
+    и только в пределах лимита пользователя; любая ошибка — пустой ответ без кэша.
+    """
+    query = update.inline_query
+    user_id = query.from_user.id
+    top, bottom = parse_inline_query(query.query)
+    if not (top or bottom) or not config.INLINE_CHAT_ID or not template_registry.names():
+        await answer_inline(query, [], config.INLINE_CACHE_TTL)
+        return
 
+    text = f"{top}|{bottom}"
+    results = inline_cache.get(text)
+    if results is not None:
+        await answer_inline(query, results, config.INLINE_CACHE_TTL)
+        return
+
+    inline_latest.begin(user_id, query.id)
+    try:
+        metrics.set_request_labels(renderer="template", chat_type="inline")
+        names = template_registry.names()[:config.INLINE_RESULTS]
+        # Шаблоны маленькие — минимальный шрифт в масштабе шаблона, как у превью
+        params = [dict(template=name, top_text=top, bottom_text=bottom, min_font_size=16) for name in names]
+        keys = [cache_key(template_registry.digest(name), "classic", p) for name, p in zip(names, params)]
+        file_ids = [result_cache.get(key) for key in keys]
+        missing = [i for i, file_id in enumerate(file_ids) if file_id is None]
+        if missing:
+            # Пользователь ещё печатает — ответ на этот запрос клиент уже не покажет
+            await asyncio.sleep(config.INLINE_DEBOUNCE)
+            if not inline_latest.is_latest(user_id, query.id):
+                return
+            reason, _ = admission.check(user_id)
+            if reason is None and render_pool.is_full():
+                reason = "busy"
+                admission.reject(reason)
+            if reason:
+                # Пустой ответ без кэша — Telegram повторит запрос при следующем вводе
+                await answer_inline(query, [], 0)
+                return
+            try:
+                rendered = await gather_or_cancel(*(render_pool.submit("classic", b"", **params[i]) for i in missing))
+                if not inline_latest.is_latest(user_id, query.id):
+                    return
+                uploaded = await upload_inline(context.bot, rendered)
+            except Exception as e:
+                if isinstance(e, RenderBusy):
+                    admission.reject("busy")
+                log_error(user_id, f"Инлайн-запрос не отрендерен: {e!r}")
+                await answer_inline(query, [], 0)
+                return
+            for i, message in zip(missing, uploaded):
+                file_ids[i] = message.photo[-1].file_id
+                result_cache.put(keys[i], file_ids[i])
+        results = [InlineQueryResultCachedPhoto(id=key[:32], photo_file_id=file_id)
+                   for key, file_id in zip(keys, file_ids)]
+        inline_cache.put(text, results)
+        logger.info(f"Инлайн-запрос: {len(results)} шаблонов, отрендерено {len(missing)}")
+        await answer_inline(query, results, config.INLINE_CACHE_TTL)
+    finally:
+        inline_latest.end(user_id, query.id)
 
 
 # === ЗАПУСК ===
+async def post_init(app: Application):
+    """Запускается до polling/webhook: апдейты начнут приниматься только после прогрева"""
+    global metrics_server
+    cleaner.start(app.bot)
+    register_metrics(app)
+    if config.METRICS_PORT:
+        # Сервер метрик — первым: пока идёт прогрев, /readyz отвечает 503
+        metrics_server = HttpServer(config.METRICS_LISTEN, config.METRICS_PORT)
+        metrics_server.route("GET", "/metrics", metrics_handler)
+        metrics_server.route("GET", "/readyz", ready_handler)
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            logger.warning(f"Метрики недоступны: {e}")
+            metrics_server = None
+    with startup.phase("pool"):
+        render_pool.start()
+    if config.WARMUP:
+        with startup.phase("renders"):
+            failed = await warm_renders(render_pool, config.WARMUP_SIDE, config.OUTPUT_FORMAT)
+        if failed:
+            logger.warning(f"Прогрев: {failed} рендеров с ошибкой, первые запросы могут быть медленнее")
+    startup.finish()
+
+
+async def post_shutdown(app: Application):
+    logger.info(f"Обработка апдейтов: {app.update_processor.stats()}")
+    await albums.stop()
+    logger.info(f"Альбомы: {albums.stats()}")
+    logger.info(f"Допуск: {admission.stats()}")
+    if metrics_server is not None:
+        await metrics_server.stop()
+    await cleaner.stop()
+    logger.info(f"Очистка сообщений: {cleaner.stats()}")
+    render_pool.shutdown()
+    sessions.close()
+    logger.info(f"Кэш результатов: {result_cache.stats()}")
+    logger.info(f"Кэш инлайн-ответов: {inline_cache.stats()}")
+    result_cache.close()
+
+
 def main():
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not token:
         print("Ошибка: Установите TELEGRAM_BOT_TOKEN")
         return
-    check_fonts_presence()
-    app = Application.builder().token(token).build()
+    # Шрифты и шаблоны грузим до запуска пула: форкнутые воркеры получат их готовыми
+    with startup.phase("fonts"):
+        warm_fonts(font_registry)
+    with startup.phase("templates"):
+        template_registry.preload()
+    builder = (
+        Application.builder()
+        .token(token)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .request(MeteredRequest(connection_pool_size=256))
+        .get_updates_request(MeteredRequest())
+        # Разные пользователи — параллельно, один пользователь — строго по порядку
+        .concurrent_updates(PerUserUpdateProcessor(config.UPDATE_CONCURRENCY, config.UPDATE_MAX_PENDING, sessions))
+    )
+    if config.TELEGRAM_API_URL:
+        builder.base_url(f"{config.TELEGRAM_API_URL}/bot").base_file_url(f"{config.TELEGRAM_API_URL}/file/bot")
+    app = builder.build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("size", size_command))
-    app.add_handler(CallbackQueryHandler(button_callback))
+    app.add_handler(CommandHandler("template", template_command))
+    app.add_handler(CallbackQueryHandler(wizard_callback))
+    app.add_handler(InlineQueryHandler(inline_query))
     # Обрабатываем фото, анимации и видео
-    app.add_handler(MessageHandler(filters.PHOTO | filters.ANIMATION | filters.VIDEO, handle_photo))
+    app.add_handler(MessageHandler((filters.PHOTO | filters.ANIMATION | filters.VIDEO) & mentioned_or_private, handle_photo))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
-    print("Бот запущен...")
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    if config.BOT_MODE == "webhook":
+        if not config.WEBHOOK_URL:
+            print("Ошибка: для BOT_MODE=webhook установите WEBHOOK_URL")
+            return
+        print("Бот запущен (webhook)...")
+        asyncio.run(serve_webhook(
+            app, config.WEBHOOK_URL, config.WEBHOOK_LISTEN, config.WEBHOOK_PORT,
+            config.WEBHOOK_SECRET, config.WEBHOOK_MAX_CONNECTIONS, startup=startup,
+        ))
+    else:
+        print("Бот запущен...")
+        app.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == '__main__':
 
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+BULK_LIMIT = 100  # deleteMessages принимает до 100 id за раз
+
+
+def _retry_delay(e: RetryAfter) -> float:
+    delay = e.retry_after
+    return delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+
+
+# === ФОНОВАЯ ОЧИСТКА СЛУЖЕБНЫХ СООБЩЕНИЙ ===
+class MessageCleaner:
+    """Очередь удаления сообщений вне критического пути ответа.
+
+    Удаления копятся коротким окном, группируются по чату и уходят пачками через
+    deleteMessages (или по одному, если метода нет), с учётом RetryAfter и повторами с backoff.
+    """
+
+    def __init__(self, batch_window: float = 0.5, max_retries: int = 3, base_delay: float = 1.0):
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._bot = None
+        self.deleted = 0
+        self.failed = 0
+        self.retries = 0
+
+    def schedule(self, chat_id: int, message_ids):
+        ids = [m for m in message_ids if m]
+        if ids:
+            self._queue.put_nowait((chat_id, ids))
+
+    def start(self, bot):
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="message_cleaner")
+
+    async def stop(self, timeout: float = 5.0):
+        """Дочищает очередь (не дольше timeout) и останавливает воркер"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Очистка не успела: в очереди {self._queue.qsize()}")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(self.batch_window)
+            batch += self._drain()
+            try:
+                by_chat = {}
+                for chat_id, ids in batch:
+                    by_chat.setdefault(chat_id, []).extend(ids)
+                for chat_id, ids in by_chat.items():
+                    unique = list(dict.fromkeys(ids))
+                    for i in range(0, len(unique), BULK_LIMIT):
+                        await self._delete(chat_id, unique[i:i + BULK_LIMIT])
+            except Exception as e:
+                logger.error(f"Ошибка очистки сообщений: {e}", exc_info=True)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _drain(self) -> list:
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return items
+
+    async def _delete(self, chat_id: int, ids: list):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if hasattr(self._bot, "delete_messages"):
+                    await self._bot.delete_messages(chat_id=chat_id, message_ids=ids)
+                    self.deleted += len(ids)
+                    return
+                # Старый python-telegram-bot без deleteMessages: по одному
+                while ids:
+                    try:
+                        await self._bot.delete_message(chat_id=chat_id, message_id=ids[0])
+                        self.deleted += 1
+                    except BadRequest:
+                        self.failed += 1
+                    ids = ids[1:]
+                return
+            except RetryAfter as e:
+                delay = _retry_delay(e)
+            except (BadRequest, Forbidden) as e:
+                # Сообщение уже удалено, слишком старое или нет прав — повтор не поможет
+                logger.info(f"Не удалось удалить {len(ids)} сообщ. в чате {chat_id}: {e}")
+                self.failed += len(ids)
+                return
+            except NetworkError:
+                delay = self.base_delay * (2 ** attempt)
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(delay)
+        logger.warning(f"Очистка чата {chat_id}: исчерпаны повторы для {len(ids)} сообщ.")
+        self.failed += len(ids)
+
+    def stats(self) -> dict:
+        return {"pending": self._queue.qsize(), "deleted": self.deleted, "failed": self.failed, "retries": self.retries}
@@ -0,0 +1,135 @@
+import hashlib
+import hmac
+import os
+
+# === НАСТРОЙКИ (из переменных окружения) ===
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        return default
+
+
+# === ПУЛ РЕНДЕРА ===
+# RENDER_POOL: "process" (по умолчанию) или "thread"
+RENDER_POOL = os.getenv("RENDER_POOL", "process").lower()
+# 0 = по числу ядер
+RENDER_WORKERS = _env_int("RENDER_WORKERS", 0)
+# Таймаут одного рендера, секунды
+RENDER_TIMEOUT = _env_float("RENDER_TIMEOUT", 30.0)
+
+# Сколько задач может ждать свободного воркера; дальше — ответ «занято» (0 — без ограничения)
+RENDER_QUEUE_MAX = _env_int("RENDER_QUEUE_MAX", 64)
+
+# === ЛИМИТЫ ===
+# Фото и рендеры в минуту на пользователя и на групповой чат (0 — без лимита) и запас для всплеска
+USER_RATE_PER_MINUTE = _env_float("USER_RATE_PER_MINUTE", 20.0)
+USER_BURST = _env_int("USER_BURST", 5)
+CHAT_RATE_PER_MINUTE = _env_float("CHAT_RATE_PER_MINUTE", 60.0)
+CHAT_BURST = _env_int("CHAT_BURST", 15)
+
+# === ДЕКОДИРОВАНИЕ ===
+# Максимум пикселей во входной картинке (защита от «бомб» распаковки)
+MAX_IMAGE_PIXELS = _env_int("MAX_IMAGE_PIXELS", 30_000_000)
+
+# === СЕССИИ МАСТЕРА ===
+SESSION_TTL = _env_float("SESSION_TTL", 1800.0)
+SESSION_MAX_BYTES = _env_int("SESSION_MAX_BYTES", 256 * 1024 * 1024)
+SESSION_MAX_ENTRIES = _env_int("SESSION_MAX_ENTRIES", 10000)
+# Выгружать холодные фото во временную папку вместо вытеснения сессии
+SESSION_SPILL = os.getenv("SESSION_SPILL", "1") not in ("0", "false", "no")
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR") or None
+
+# Общее хранилище сессий для нескольких экземпляров бота и перезапусков:
+# "local" (по умолчанию, только память процесса), "memory", "sqlite" или "redis"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "local").lower()
+SESSION_DB = os.getenv("SESSION_DB", "sessions.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+
+# === КЭШ ГОТОВЫХ МЕМОВ ===
+RESULT_CACHE_SIZE = _env_int("RESULT_CACHE_SIZE", 5000)
+# Путь к SQLite для кэша между перезапусками (пусто — только в памяти)
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB") or None
+
+# === GIF / ВИДЕО ===
+ANIMATION_MAX_FRAMES = _env_int("ANIMATION_MAX_FRAMES", 300)
+ANIMATION_MAX_SIDE = _env_int("ANIMATION_MAX_SIDE", 640)
+ANIMATION_TIMEOUT = _env_float("ANIMATION_TIMEOUT", 120.0)
+# Без ffmpeg GIF собирает Pillow и держит все кадры в памяти до записи — лимит кадров меньше
+ANIMATION_GIF_MAX_FRAMES = _env_int("ANIMATION_GIF_MAX_FRAMES", 60)
+
+# === КОДИРОВАНИЕ РЕЗУЛЬТАТА ===
+# OUTPUT_FORMAT: "jpeg" (по умолчанию), "webp" или "sticker" (WebP 512px, отправляется стикером)
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "jpeg").lower()
+OUTPUT_QUALITY = _env_int("OUTPUT_QUALITY", 95)
+# Лимит размера файла: качество подбирается под него (0 — без лимита)
+OUTPUT_MAX_BYTES = _env_int("OUTPUT_MAX_BYTES", 2 * 1024 * 1024)
+# Большая сторона результата; Telegram всё равно ужимает фото до 2560 (0 — без лимита)
+OUTPUT_MAX_SIDE = _env_int("OUTPUT_MAX_SIDE", 2560)
+OUTPUT_OPTIMIZE = os.getenv("OUTPUT_OPTIMIZE", "1") not in ("0", "false", "no")
+OUTPUT_PROGRESSIVE = os.getenv("OUTPUT_PROGRESSIVE", "0") not in ("0", "false", "no")
+
+# === АЛЬБОМЫ ===
+# Сколько ждать следующее фото альбома, секунды
+ALBUM_DEBOUNCE = _env_float("ALBUM_DEBOUNCE", 1.0)
+
+# === ИНЛАЙН-РЕЖИМ (@memfy_bot верх|низ) ===
+# Чат или канал, куда бот загружает результаты, чтобы получить file_id (без него инлайн-режим выключен)
+INLINE_CHAT_ID = _env_int("INLINE_CHAT_ID", 0)
+# Сколько шаблонов в ответе и сколько секунд помнить ответ на одинаковый запрос
+INLINE_RESULTS = _env_int("INLINE_RESULTS", 10)
+INLINE_CACHE_TTL = _env_float("INLINE_CACHE_TTL", 60.0)
+# Пауза перед рендером: если за это время пришёл более новый запрос (пользователь печатает), старый не рендерим
+INLINE_DEBOUNCE = _env_float("INLINE_DEBOUNCE", 0.4)
+# Большая сторона шаблона в памяти и в инлайн-результате
+TEMPLATE_SIDE = _env_int("TEMPLATE_SIDE", 512)
+# Индекс и пиксели шаблонов (пусто — во временной папке); пересобираются, если memes/ изменилась
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR") or None
+
+# === ПРЕВЬЮ В МАСТЕРЕ ===
+# Маленькое превью после каждого выбора стиля (0 — выключить)
+WIZARD_PREVIEW = os.getenv("WIZARD_PREVIEW", "1") not in ("0", "false", "no")
+PREVIEW_SIDE = _env_int("PREVIEW_SIDE", 256)
+
+# === ХОЛОДНЫЙ СТАРТ ===
+# Перед приёмом апдейтов — по рендеру каждого движка в каждом воркере пула (0 — выключить)
+WARMUP = os.getenv("WARMUP", "1") not in ("0", "false", "no")
+# Большая сторона синтетической картинки для прогрева
+WARMUP_SIDE = _env_int("WARMUP_SIDE", 640)
+
+# === ОБРАБОТКА АПДЕЙТОВ ===
+# Сколько обработчиков выполняются одновременно (апдейты одного пользователя — всегда по очереди)
+UPDATE_CONCURRENCY = _env_int("UPDATE_CONCURRENCY", 64)
+# Сколько апдейтов может ждать своей очереди
+UPDATE_MAX_PENDING = _env_int("UPDATE_MAX_PENDING", 1024)
+
+# === РЕЖИМ РАБОТЫ ===
+# BOT_MODE: "polling" (по умолчанию) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Публичный HTTPS-адрес webhook, путь из него слушает встроенный сервер (например https://host/telegram)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = _env_int("WEBHOOK_PORT", _env_int("PORT", 8443))
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (пусто — выводится из токена бота).
+# Должен совпадать у всех экземпляров за одним webhook: последний запущенный перезаписывает его в setWebhook
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hmac.new(
+    os.getenv("TELEGRAM_BOT_TOKEN", "").encode(), b"memfy-webhook-secret", hashlib.sha256).hexdigest()
+WEBHOOK_MAX_CONNECTIONS = _env_int("WEBHOOK_MAX_CONNECTIONS", 40)
+# Другой адрес Bot API (локальный Bot API сервер или фейковый Telegram для тестов), например http://127.0.0.1:8081
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")
+
+# === МЕТРИКИ ===
+# Prometheus-метрики на http://METRICS_LISTEN:METRICS_PORT/metrics (0 — выключено)
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = _env_int("METRICS_PORT", 9464)
@@ -0,0 +1,46 @@
+import logging
+
+from PIL import Image
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class ImageTooLarge(ValueError):
+    """Картинка больше бюджета пикселей"""
+
+
+# === ДЕКОДИРОВАНИЕ ВХОДНОГО ФОТО ===
+def open_image(fp, max_pixels: int = None) -> Image.Image:
+    """Открывает картинку без декодирования пикселей и проверяет бюджет пикселей"""
+    max_pixels = max_pixels or config.MAX_IMAGE_PIXELS
+    im = Image.open(fp)
+    w, h = im.size
+    if w * h > max_pixels:
+        raise ImageTooLarge(f"{w}x{h} больше лимита {max_pixels} пикселей")
+    return im
+
+
+def load_rgb(im: Image.Image, target_size: tuple = None) -> Image.Image:
+    """Декодирует в RGB; для JPEG — сразу в уменьшенном масштабе (DCT 1/2, 1/4, 1/8),
+    но не меньше target_size"""
+    source_size, source_format = im.size, im.format
+    if target_size and source_format == 'JPEG':
+        im.draft('RGB', (max(1, int(target_size[0])), max(1, int(target_size[1]))))
+    elif target_size:
+        # Прочие форматы декодируются целиком, но дальше работаем с уменьшенной копией
+        factor = min(source_size[0] // max(1, int(target_size[0])), source_size[1] // max(1, int(target_size[1])))
+        if factor >= 2:
+            # reduce() понимает не все режимы (P, 1, I;16 — ValueError): палитровые PNG/GIF сначала в RGB
+            if im.mode != 'RGB':
+                im = im.convert('RGB')
+            im = im.reduce(factor)
+    rgb = im.convert('RGB')
+    logger.info(f"Декодировано: {source_format or 'raw'} {source_size[0]}x{source_size[1]} → {rgb.width}x{rgb.height}")
+    return rgb
+
+
+def decode_image(fp, target_size: tuple = None, max_pixels: int = None) -> Image.Image:
+    """Открывает, проверяет размер и декодирует в RGB не крупнее нужного"""
+    return load_rgb(open_image(fp, max_pixels), target_size)
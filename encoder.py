@@ -0,0 +1,111 @@
+import io
+import logging
+import threading
+import time
+
+from PIL import Image
+
+import config
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ("jpeg", "webp", "sticker")
+STICKER_SIDE = 512                # статичный стикер: одна сторона ровно 512, другая не больше
+STICKER_MAX_BYTES = 512 * 1024    # лимит Telegram на WebP-стикер
+MIN_QUALITY = 40                  # ниже качество не опускаем — уменьшаем разрешение
+MAX_DOWNSCALES = 3
+
+# Буфер на поток: пробные кодирования при подборе качества пишутся в один и тот же BytesIO.
+# truncate() не вызываем — он перевыделяет память; проба пишется с начала поверх прежней,
+# её длина — позиция после записи, хвост от прошлых проб не читается.
+_scratch = threading.local()
+
+
+def _buffer() -> io.BytesIO:
+    buf = getattr(_scratch, "buf", None)
+    if buf is None:
+        buf = _scratch.buf = io.BytesIO()
+    return buf
+
+
+def _contents(buf: io.BytesIO, size: int) -> bytes:
+    with buf.getbuffer() as view:
+        return view[:size].tobytes()
+
+
+def _save(image: Image.Image, buf: io.BytesIO, fmt: str, quality: int) -> int:
+    buf.seek(0)
+    if fmt == "jpeg":
+        image.save(buf, format='JPEG', quality=quality, optimize=config.OUTPUT_OPTIMIZE,
+                   progressive=config.OUTPUT_PROGRESSIVE)
+    else:
+        image.save(buf, format='WEBP', quality=quality, method=4)
+    return buf.tell()
+
+
+def fit_resolution(image: Image.Image, max_side: int) -> Image.Image:
+    """Уменьшает так, чтобы большая сторона была не больше max_side"""
+    if not max_side or max(image.size) <= max_side:
+        return image
+    scale = max_side / max(image.size)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def sticker_size(image: Image.Image) -> Image.Image:
+    scale = STICKER_SIDE / max(image.size)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+# === КОДИРОВАНИЕ РЕЗУЛЬТАТА ===
+def encode_image(image: Image.Image, output: str = "jpeg", quality: int = None,
+                 max_bytes: int = None, max_side: int = None) -> io.BytesIO:
+    """JPEG/WebP/стикер с подбором качества под лимит байт и разрешения.
+
+    Сначала пробуем заданное качество; если не влезли в max_bytes — двоичный поиск качества
+    до MIN_QUALITY, затем уменьшение разрешения. Пробы идут в общий буфер потока.
+    """
+    started = time.perf_counter()
+    quality = quality or config.OUTPUT_QUALITY
+    max_bytes = config.OUTPUT_MAX_BYTES if max_bytes is None else max_bytes
+    max_side = config.OUTPUT_MAX_SIDE if max_side is None else max_side
+    if output == "sticker":
+        fmt = "webp"
+        image = sticker_size(image)
+        max_bytes = min(max_bytes or STICKER_MAX_BYTES, STICKER_MAX_BYTES)
+    else:
+        fmt = "webp" if output == "webp" else "jpeg"
+        image = fit_resolution(image, max_side)
+
+    buf = _buffer()
+    passes = 1
+    size = _save(image, buf, fmt, quality)
+    result, used = (_contents(buf, size), quality) if not max_bytes or size <= max_bytes else (None, None)
+
+    # Исходное качество в исходном размере уже проверено; после уменьшения ищем и его тоже
+    hi = quality - 1
+    for _ in range(MAX_DOWNSCALES + 1):
+        if result is not None:
+            break
+        lo = MIN_QUALITY
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            passes += 1
+            size = _save(image, buf, fmt, mid)
+            if size <= max_bytes:
+                result, used, lo = _contents(buf, size), mid, mid + 1
+            else:
+                hi = mid - 1
+        hi = quality
+        if result is None:
+            # Даже минимальное качество не влезло — уменьшаем сторону на четверть
+            image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)),
+                                 Image.Resampling.LANCZOS)
+    if result is None:
+        passes += 1
+        result, used = _contents(buf, _save(image, buf, fmt, MIN_QUALITY)), MIN_QUALITY
+
+    logger.info(f"Кодирование {output}: {image.width}x{image.height}, q={used}, {len(result)} байт, "
+                f"{(time.perf_counter() - started) * 1000:.0f} мс, проходов: {passes}")
+    return io.BytesIO(result)
@@ -0,0 +1,86 @@
+"""Локальная замена Redis для проверки SESSION_BACKEND=redis без настоящего сервера.
+
+    python fake_redis.py --port 6390
+    SESSION_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 python bot.py
+
+Понимает PING, AUTH, SELECT, GET, SET (EX/PX), DEL, DBSIZE и печатает число команд при остановке.
+"""
+import argparse
+import asyncio
+import time
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}  # ключ → (значение, истекает или None)
+        self.commands = 0
+
+    def _get(self, key: bytes):
+        item = self.data.get(key)
+        if item is not None and item[1] is not None and item[1] < time.monotonic():
+            del self.data[key]
+            return None
+        return item[0] if item else None
+
+    def execute(self, args: list) -> bytes:
+        self.commands += 1
+        name = args[0].upper()
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name in (b"AUTH", b"SELECT"):
+            return b"+OK\r\n"
+        if name == b"GET":
+            value = self._get(args[1])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == b"SET":
+            expires = None
+            if len(args) >= 5 and args[3].upper() in (b"PX", b"EX"):
+                scale = 1000 if args[3].upper() == b"PX" else 1
+                expires = time.monotonic() + int(args[4]) / scale
+            self.data[args[1]] = (args[2], expires)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            removed = sum(self.data.pop(k, None) is not None for k in args[1:])
+            return b":%d\r\n" % removed
+        if name == b"DBSIZE":
+            return b":%d\r\n" % len(self.data)
+        return b"-ERR unknown command\r\n"
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                args = []
+                for _ in range(int(header[1:-2])):
+                    size = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                writer.write(self.execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Фейковый Redis для сессий memfy_bot")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    fake = FakeRedis()
+    server = await asyncio.start_server(fake.handle, "127.0.0.1", args.port)
+    print(f"Фейковый Redis на 127.0.0.1:{args.port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        print(f"Команд: {fake.commands}, ключей: {len(fake.data)}")
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
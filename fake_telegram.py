@@ -0,0 +1,135 @@
+"""Фейковый Bot API для локальной проверки и замера задержки polling vs webhook.
+
+    python fake_telegram.py --port 8081 --updates 200
+    TELEGRAM_API_URL=http://127.0.0.1:8081 TELEGRAM_BOT_TOKEN=1:fake python bot.py
+    TELEGRAM_API_URL=http://127.0.0.1:8081 TELEGRAM_BOT_TOKEN=1:fake BOT_MODE=webhook \
+        WEBHOOK_URL=http://127.0.0.1:8443/telegram python bot.py
+
+Сервер по одному шлёт боту /start (через getUpdates или POST на webhook) и замеряет время
+до ответного sendMessage.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import parse_qs
+
+import httpx
+
+from http_server import HttpServer, json_response
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "memfy", "username": "memfy_bot",
+            "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+CHAT = {"id": 100, "type": "private", "first_name": "Test"}
+USER = {"id": 100, "is_bot": False, "first_name": "Test"}
+
+
+class FakeTelegram:
+    def __init__(self, token: str, updates: int):
+        self.token = token
+        self.total = updates
+        self.queue = asyncio.Queue()       # апдейты для getUpdates
+        self.webhook = None                # (url, secret) после setWebhook
+        self.replied = asyncio.Event()
+        self.ready = asyncio.Event()       # бот начал забирать апдейты
+        self.latencies = []
+        self._message_id = 0
+
+    def _ok(self, result):
+        return json_response({"ok": True, "result": result})
+
+    def _message(self, **extra) -> dict:
+        self._message_id += 1
+        return {"message_id": self._message_id, "date": int(time.time()), "chat": CHAT, "from": BOT_USER, **extra}
+
+    def routes(self, server: HttpServer):
+        methods = {
+            "getMe": self.get_me, "getUpdates": self.get_updates, "setWebhook": self.set_webhook,
+            "deleteWebhook": self.delete_webhook, "sendMessage": self.send_message,
+        }
+        for name in ("sendPhoto", "sendAnimation", "sendSticker", "editMessageText", "answerCallbackQuery",
+                     "deleteMessages", "deleteMessage"):
+            methods.setdefault(name, self.generic)
+        for name, handler in methods.items():
+            server.route("POST", f"/bot{self.token}/{name}", handler)
+
+    # --- методы Bot API ---
+    async def get_me(self, request):
+        return self._ok(BOT_USER)
+
+    async def delete_webhook(self, request):
+        self.webhook = None
+        return self._ok(True)
+
+    async def set_webhook(self, request):
+        params = parse_qs(request.body.decode())
+        self.webhook = (params["url"][0], params.get("secret_token", [""])[0])
+        self.ready.set()
+        return self._ok(True)
+
+    async def get_updates(self, request):
+        params = parse_qs(request.body.decode())
+        timeout = float(params.get("timeout", ["0"])[0])
+        self.ready.set()
+        try:
+            update = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return self._ok([])
+        return self._ok([update])
+
+    async def send_message(self, request):
+        params = parse_qs(request.body.decode())
+        self.replied.set()
+        return self._ok(self._message(text=params.get("text", [""])[0]))
+
+    async def generic(self, request):
+        return self._ok(self._message(text=""))
+
+    # --- нагрузка ---
+    def _update(self, n: int) -> dict:
+        return {"update_id": n, "message": {
+            "message_id": 10_000 + n, "date": int(time.time()), "chat": CHAT, "from": USER,
+            "text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        }}
+
+    async def run(self):
+        await self.ready.wait()
+        await asyncio.sleep(0.5)  # бот дозапускается
+        mode = "webhook" if self.webhook else "polling"
+        async with httpx.AsyncClient() as client:
+            for n in range(1, self.total + 1):
+                self.replied.clear()
+                started = time.perf_counter()
+                if self.webhook:
+                    url, secret = self.webhook
+                    await client.post(url, content=json.dumps(self._update(n)),
+                                      headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+                else:
+                    self.queue.put_nowait(self._update(n))
+                await asyncio.wait_for(self.replied.wait(), 30)
+                self.latencies.append((time.perf_counter() - started) * 1000)
+        lat = sorted(self.latencies)
+        print(f"{mode}: {len(lat)} апдейтов, p50 {statistics.median(lat):.1f} мс, "
+              f"p95 {lat[int(len(lat) * 0.95) - 1]:.1f} мс, max {lat[-1]:.1f} мс")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Фейковый Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--token", default="1:fake")
+    parser.add_argument("--updates", type=int, default=100)
+    args = parser.parse_args()
+
+    fake = FakeTelegram(args.token, args.updates)
+    server = HttpServer("127.0.0.1", args.port)
+    fake.routes(server)
+    await server.start()
+    try:
+        await fake.run()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import ImageFont
+
+logger = logging.getLogger(__name__)
+
+# === ШРИФТЫ В ТОЙ ЖЕ ПАПКЕ, ЧТО И bot.py ===
+FONT_DIR = os.path.dirname(os.path.abspath(__file__))  # ← шрифты рядом с bot.py
+
+# === СПИСОК ШРИФТОВ: канонический ключ → файл ===
+# Ключ используется в callback_data ("font_<ключ>", "classic_font_<ключ>") и в сессии
+FONT_FILES = {
+    "molodost": "Molodost.ttf",
+    "roboto": "Roboto_Bold.ttf",
+    "times": "Times New Roman Bold Italic.ttf",
+    "nougat": "Nougat Regular.ttf",
+    "maratype": "Maratype Regular.ttf",
+    "farabee": "Farabee Bold.ttf",
+    "impact": "Impact.ttf",
+    "anton": "Anton-Regular.ttf",
+    "comicsans": "Comic Sans MS.ttf",
+    "arial_black": "Arial_black.ttf",
+    "lobster": "Lobster.ttf",
+}
+
+# Шрифты, доступные в мастере
+DEMOTIVATOR_FONTS = ["molodost", "roboto", "times", "nougat", "maratype", "farabee",
+                     "impact", "anton", "comicsans", "arial_black"]
+CLASSIC_FONTS = ["impact", "lobster"]
+
+WATERMARK_FONT = "roboto"
+WATERMARK_FONT_SIZE = 16
+
+
+def font_title(key: str) -> str:
+    """Человекочитаемое имя шрифта: 'Roboto_Bold.ttf' → 'Roboto Bold'"""
+    return FONT_FILES.get(key, key).split('.')[0].replace('_', ' ')
+
+
+def _load_default(size: int):
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1 не умеет размер
+        return ImageFont.load_default()
+
+
+# === РЕЕСТР ШРИФТОВ ===
+class FontRegistry:
+    """Загружает шрифты один раз и раздаёт закэшированные FreeTypeFont по (ключ, размер)"""
+
+    def __init__(self, font_dir: str = FONT_DIR, font_files: dict = None, cache_size: int = 64):
+        self.font_dir = font_dir
+        self.font_files = dict(font_files or FONT_FILES)
+        self.cache_size = cache_size
+        self._data = {}  # ключ → байты файла шрифта
+        self._missing = set()
+        self._loaded = False
+        self._cache = OrderedDict()  # (ключ, размер) → FreeTypeFont
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, name: str) -> str:
+        """Приводит ключ или имя файла к каноническому ключу"""
+        if name in self.font_files:
+            return name
+        base = os.path.basename(name)
+        for key, fname in self.font_files.items():
+            if fname == base:
+                return key
+        raise KeyError(f"Неизвестный шрифт: {name}")
+
+    def preload(self) -> list:
+        """Проверяет и загружает все шрифты; возвращает список недоступных ключей"""
+        if self._loaded:
+            return sorted(self._missing)
+        logger.info(f"Загрузка шрифтов из: {self.font_dir}")
+        for key, fname in self.font_files.items():
+            path = os.path.join(self.font_dir, fname)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                ImageFont.truetype(io.BytesIO(data), WATERMARK_FONT_SIZE)  # валидация файла
+            except OSError as e:
+                self._missing.add(key)
+                logger.warning(f"Шрифт НЕ загружен: {fname} ({e}), будет использован стандартный")
+                continue
+            self._data[key] = data
+            logger.info(f"Шрифт загружен: {fname}")
+        self._loaded = True
+        return sorted(self._missing)
+
+    def is_available(self, name: str) -> bool:
+        self.preload()
+        return self.resolve(name) in self._data
+
+    def get(self, name: str, size: int):
+        """FreeTypeFont для (шрифт, размер); редкие размеры вытесняются по LRU"""
+        if not self._loaded:
+            self.preload()
+        cache_key = (self.resolve(name), int(size))
+        with self._lock:
+            font = self._cache.get(cache_key)
+            if font is not None:
+                self._cache.move_to_end(cache_key)
+                self.hits += 1
+                return font
+            self.misses += 1
+        data = self._data.get(cache_key[0])
+        if data is None:
+            font = _load_default(cache_key[1])
+        else:
+            font = ImageFont.truetype(io.BytesIO(data), cache_key[1])
+        with self._lock:
+            self._cache[cache_key] = font
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return font
+
+
+# Один реестр на процесс (в воркерах пула — свой, загружается при первом рендере)
+registry = FontRegistry()
+
+
+def get_font(name: str, size: int):
+    return registry.get(name, size)
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY = 1024 * 1024  # апдейт Telegram — несколько КБ, мегабайта с запасом
+IDLE_TIMEOUT = 75.0     # сколько держать keep-alive соединение без запросов
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, target: str, headers: dict, body: bytes):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path
+        self.query = parse_qs(url.query)
+        self.headers = headers  # имена в нижнем регистре
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def json_response(data, status: int = 200) -> tuple:
+    return status, "application/json", json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def text_response(text: str, status: int = 200, content_type: str = "text/plain; charset=utf-8") -> tuple:
+    return status, content_type, text.encode('utf-8')
+
+
+# === МИНИМАЛЬНЫЙ HTTP-СЕРВЕР НА ASYNCIO ===
+class HttpServer:
+    """HTTP/1.1 с keep-alive поверх asyncio.start_server — без внешних зависимостей.
+
+    Обработчик маршрута: async (Request) -> (статус, content-type, байты тела).
+    """
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 8080):
+        self.host = host
+        self.port = port
+        self._routes = {}
+        self._server = None
+        self._connections = set()
+
+    def route(self, method: str, path: str, handler):
+        self._routes[(method.upper(), path)] = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        # port=0 — свободный порт (удобно для локальных тестов)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP-сервер слушает {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # keep-alive соединения закрываем сами, иначе wait_closed будет их ждать
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError):
+                    return
+                lines = head.decode('latin-1').split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._write(writer, (400, "text/plain", b""), keep_alive=False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(":")
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+
+                # Только десятичные цифры: int() принял бы «+5», « 5», «1_0», а «-1» или «abc» уронил бы соединение
+                length = headers.get("content-length", "0")
+                if not (length.isascii() and length.isdigit()) or "transfer-encoding" in headers:
+                    await self._write(writer, (400, "text/plain", b""), keep_alive=False)
+                    return
+                length = int(length)
+                if length > MAX_BODY:
+                    await self._write(writer, (413, "text/plain", b""), keep_alive=False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                response = await self._dispatch(Request(method.upper(), target, headers, body))
+                await self._write(writer, response, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # клиент ушёл или сервер останавливается
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, request: Request) -> tuple:
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            allowed = any(path == request.path for _, path in self._routes)
+            return (405 if allowed else 404), "text/plain", b""
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"Ошибка обработки {request.method} {request.path}: {e}", exc_info=True)
+            return 500, "text/plain", b""
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, response: tuple, keep_alive: bool):
+        status, content_type, body = response
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
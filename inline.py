@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+
+
+def parse_inline_query(text: str) -> tuple:
+    """'верх|низ' → (верх, низ); без разделителя — только нижняя подпись"""
+    text = " ".join(text.split())
+    if '|' in text:
+        top, bottom = text.split('|', 1)
+        return top.strip(), bottom.strip()
+    return "", text
+
+
+# === КЭШ ОТВЕТОВ НА ИНЛАЙН-ЗАПРОСЫ ===
+class QueryCache:
+    """Запрос → готовый список результатов на короткое время.
+
+    Пока пользователь печатает, Telegram шлёт запрос на каждую букву, а при стирании — те же
+    запросы повторно; повтор отвечается без обращения к кэшу file_id и пулу рендера.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # запрос → (истекает, результаты)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: str):
+        entry = self._entries.get(query)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[query]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(query)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, query: str, results: list):
+        self._entries[query] = (time.monotonic() + self.ttl, results)
+        self._entries.move_to_end(query)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# === УСТАРЕВШИЕ ЗАПРОСЫ ===
+class LatestQueries:
+    """Последний инлайн-запрос каждого пользователя.
+
+    Запрос, после которого пришёл более новый, клиент уже не покажет — его рендер и загрузка
+    только заняли бы пул. Запись живёт, пока последний запрос пользователя в обработке.
+    """
+
+    def __init__(self):
+        self._latest = {}  # user_id → id последнего запроса
+        self.superseded = 0
+
+    def begin(self, user_id: int, query_id: str):
+        self._latest[user_id] = query_id
+
+    def is_latest(self, user_id: int, query_id: str) -> bool:
+        if self._latest.get(user_id) == query_id:
+            return True
+        self.superseded += 1
+        return False
+
+    def end(self, user_id: int, query_id: str):
+        if self._latest.get(user_id) == query_id:
+            del self._latest[user_id]
+
+    def __len__(self) -> int:
+        return len(self._latest)
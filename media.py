@@ -0,0 +1,96 @@
+import io
+import logging
+
+from telegram import Message
+from telegram.ext import filters
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BOT_MENTION = "@memfy_bot"
+MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
+
+# До какого размера нужно фото каждому рендеру (None — самое большое).
+# Демотиватор всё равно ужимает фото до 512×512, Telegram сам пережимает фото до 1280.
+RENDER_TARGETS = {
+    "classic": (1280, 1280),
+    "demotivator": (512, 512),
+    "shakalize": (1280, 1280),
+    "shakalize_sheet": (640, 640),  # ячейки превью не больше 400px
+}
+
+
+# === ФИЛЬТР: В ГРУППАХ ТОЛЬКО С УПОМИНАНИЕМ БОТА ===
+def mentions_bot(message: Message) -> bool:
+    """Личка или сообщение группы, где в подписи упомянут бот"""
+    if message.chat.type not in ('group', 'supergroup'):
+        return True
+    caption = (message.caption or "").lower()
+    if BOT_MENTION in caption:
+        return True
+    username = message.get_bot().username
+    names = {BOT_MENTION, f"@{username.lower()}"} if username else {BOT_MENTION}
+    for e in message.caption_entities or ():
+        if e.type == "mention" and caption[e.offset:e.offset + e.length] in names:
+            return True
+    return False
+
+
+class MentionedOrPrivate(filters.MessageFilter):
+    """Пропускает личку и сообщения групп, где в подписи упомянут бот — до любых запросов к API.
+
+    Элементы альбома пропускаются все: подпись Telegram ставит только на один из них, поэтому
+    упоминание проверяется по собранному альбому целиком (bot.start_album).
+    """
+
+    def filter(self, message: Message) -> bool:
+        return bool(message.media_group_id) or mentions_bot(message)
+
+
+mentioned_or_private = MentionedOrPrivate(name="MentionedOrPrivate")
+
+
+def strip_mentions(caption: str, bot_username: str) -> str:
+    if bot_username:
+        caption = caption.replace(f"@{bot_username}", "")
+    return caption.replace(BOT_MENTION, "").strip()
+
+
+# === ССЫЛКИ НА ФОТО ВМЕСТО БАЙТОВ ===
+def photo_sizes(message: Message) -> list:
+    """Все размеры фото из сообщения как простые словари (для хранения в сессии)"""
+    return [
+        {"file_id": p.file_id, "file_unique_id": p.file_unique_id,
+         "width": p.width, "height": p.height, "file_size": p.file_size}
+        for p in message.photo
+    ]
+
+
+def animation_ref(message: Message) -> dict:
+    """GIF/видео из сообщения как простой словарь (для хранения в сессии)"""
+    media = message.animation or message.video
+    return {"file_id": media.file_id, "file_unique_id": media.file_unique_id,
+            "width": media.width, "height": media.height, "duration": media.duration,
+            "file_size": media.file_size, "mime_type": media.mime_type}
+
+
+def pick_size(sizes: list, target: tuple = None) -> dict:
+    """Наименьший размер, который покрывает target по обеим сторонам; иначе самый большой"""
+    ordered = sorted(sizes, key=lambda s: s["width"] * s["height"])
+    if target:
+        for size in ordered:
+            if size["width"] >= target[0] and size["height"] >= target[1]:
+                return size
+    return ordered[-1]
+
+
+async def download(bot, size: dict) -> bytes:
+    """Скачивает выбранный размер фото в память"""
+    with metrics.stage("get_file"):
+        file = await bot.get_file(size["file_id"])
+    buf = io.BytesIO()
+    with metrics.stage("download"):
+        await file.download_to_memory(buf)
+    logger.info(f"Скачан файл {size['width']}x{size['height']}: {buf.tell()} байт")
+    return buf.getvalue()
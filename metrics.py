@@ -0,0 +1,218 @@
+import bisect
+import contextlib
+import contextvars
+import logging
+import time
+
+from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Секунды: от быстрых обращений к API до долгих рендеров GIF/видео
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Байты: от превью и стикеров до JPEG 4K
+BYTE_BUCKETS = (16_384, 65_536, 131_072, 262_144, 524_288, 1_048_576, 2_097_152, 5_242_880, 10_485_760)
+
+# Метки текущего запроса (рендер, тип чата) — их подхватывают замеры этапов ниже по стеку
+request_labels = contextvars.ContextVar("request_labels", default={})
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# === МЕТРИКИ (формат Prometheus, без внешних зависимостей) ===
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # метки -> [счётчики по корзинам, сумма, количество]
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            entry[0][i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self):
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class GaugeFunc:
+    """Значение снимается при каждом запросе /metrics: число или словарь {значение метки: число}"""
+
+    def __init__(self, name: str, help_text: str, fn, labelname: str = None, kind: str = "gauge"):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.labelname = labelname
+        self.kind = kind
+
+    def samples(self):
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.warning(f"Метрика {self.name}: {e}")
+            return
+        if isinstance(value, dict):
+            for label, v in value.items():
+                yield f"{self.name}{_format_labels((self.labelname,), (label,))} {v}"
+        else:
+            yield f"{self.name} {value}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, fn, labelname: str = None, kind: str = "gauge") -> GaugeFunc:
+        return self.register(GaugeFunc(name, help_text, fn, labelname, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "memfy_stage_seconds", "Длительность этапов обработки медиа",
+    ("stage", "renderer", "chat_type", "result"),
+)
+OUTPUT_BYTES = registry.histogram(
+    "memfy_output_bytes", "Размер закодированного результата рендера",
+    ("renderer", "output"), BYTE_BUCKETS,
+)
+ADMISSION_REJECTED = registry.counter(
+    "memfy_admission_rejected_total", "Отказы в обработке: лимит пользователя/чата или занятая очередь", ("reason",),
+)
+WIZARD_STEP_SECONDS = registry.histogram(
+    "memfy_wizard_step_seconds", "Время обработки нажатия кнопки мастера по шагам", ("step", "result"),
+)
+FONT_CACHE_LOOKUPS = registry.counter(
+    "memfy_font_cache_lookups_total", "Обращения к кэшу шрифтов (шрифт, размер) в воркерах рендера", ("result",),
+)
+API_ERRORS = registry.counter(
+    "memfy_telegram_api_errors_total", "Ошибки запросов к Telegram Bot API", ("method", "error"),
+)
+
+
+# === ЗАМЕР ЭТАПОВ ===
+def observe_stage(stage: str, seconds: float, result: str = "ok"):
+    labels = request_labels.get()
+    STAGE_SECONDS.observe(seconds, stage=stage, result=result,
+                          renderer=labels.get("renderer", ""), chat_type=labels.get("chat_type", ""))
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """with stage("download"): ... — время этапа с метками текущего запроса, result=ok/error"""
+    started = time.perf_counter()
+    result = "ok"
+    try:
+        yield
+    except BaseException:
+        result = "error"
+        raise
+    finally:
+        observe_stage(name, time.perf_counter() - started, result)
+
+
+@contextlib.contextmanager
+def wizard_step(name: str):
+    """with wizard_step("font"): ... — время обработчика шага мастера, result=ok/error"""
+    started = time.perf_counter()
+    result = "ok"
+    try:
+        yield
+    except BaseException:
+        result = "error"
+        raise
+    finally:
+        WIZARD_STEP_SECONDS.observe(time.perf_counter() - started, step=name, result=result)
+
+
+def observe_output(nbytes: int, output: str):
+    OUTPUT_BYTES.observe(nbytes, renderer=request_labels.get().get("renderer", ""), output=output)
+
+
+def set_request_labels(**labels):
+    request_labels.set(labels)
+
+
+# === ОШИБКИ BOT API ПО МЕТОДАМ ===
+class MeteredRequest(HTTPXRequest):
+    """HTTPXRequest, который считает ошибки Bot API (RetryAfter, BadRequest, TimedOut…) по методам"""
+
+    async def post(self, url: str, *args, **kwargs):
+        try:
+            return await super().post(url, *args, **kwargs)
+        except TelegramError as e:
+            API_ERRORS.inc(method=url.rsplit('/', 1)[-1], error=type(e).__name__)
+            raise
+
+    async def retrieve(self, url: str, *args, **kwargs) -> bytes:
+        try:
+            return await super().retrieve(url, *args, **kwargs)
+        except TelegramError as e:
+            API_ERRORS.inc(method="file", error=type(e).__name__)
+            raise
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from renderers import timed_render_job
+
+logger = logging.getLogger(__name__)
+
+
+class RenderTimeout(Exception):
+    """Рендер не уложился в таймаут"""
+
+
+class RenderBusy(Exception):
+    """Очередь рендера заполнена — задачу не принимаем"""
+
+
+# === ПУЛ ВОРКЕРОВ ДЛЯ РЕНДЕРА ===
+class RenderPool:
+    """Выносит рендер Pillow из event loop в пул процессов (или потоков)"""
+
+    def __init__(self, workers: int = 0, mode: str = "process", timeout: float = 30.0, max_queue: int = 0):
+        self.workers = workers or os.cpu_count() or 1
+        self.mode = mode
+        self.timeout = timeout
+        self.max_queue = max_queue  # задач, ждущих свободного воркера (0 — без ограничения)
+        self._executor = None
+        self._started_at = None
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.busy_seconds = 0.0
+        self.rejected = 0
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.mode == "process":
+            try:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            except (OSError, NotImplementedError, PermissionError) as e:
+                logger.warning(f"Пул процессов недоступен ({e}), используем потоки")
+                self.mode = "thread"
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        self._started_at = time.monotonic()
+        logger.info(f"Пул рендера запущен: {self.mode}, воркеров: {self.workers}, таймаут: {self.timeout}с")
+
+    def shutdown(self):
+        if self._executor is None:
+            return
+        logger.info(f"Пул рендера остановлен: {self.describe()}")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def _restart(self):
+        # Упавший процесс ломает весь ProcessPoolExecutor — пересоздаём
+        logger.warning("Пул процессов сломан, перезапуск")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.start()
+
+    async def submit(self, engine: str, data: bytes, timeout: float = None, **params) -> bytes:
+        """Отправляет рендер в пул и ждёт результат (байты); timeout — свой для тяжёлых задач"""
+        if self._executor is None:
+            self.start()
+        if self.is_full():
+            self.rejected += 1
+            raise RenderBusy(f"{engine}: в очереди уже {self.queued} задач")
+        started = time.monotonic()
+        self.in_flight += 1
+        try:
+            job = self._executor.submit(timed_render_job, engine, data, params)
+            job.add_done_callback(self._account)
+            result, stages, fonts = await asyncio.wait_for(asyncio.wrap_future(job), timeout or self.timeout)
+            self.completed += 1
+            # Очередь к воркеру и передача байт между процессами — всё, что не ушло на сам рендер
+            metrics.observe_stage("queue", max(0.0, time.monotonic() - started - sum(stages.values())))
+            for stage, seconds in stages.items():
+                metrics.observe_stage(stage, seconds)
+            metrics.observe_output(len(result), params.get("output", "jpeg"))
+            # Кэш шрифтов свой в каждом воркере — счётчики приходят вместе с результатом
+            for outcome, count in fonts.items():
+                if count:
+                    metrics.FONT_CACHE_LOOKUPS.inc(count, result=outcome)
+            return result
+        except asyncio.TimeoutError:
+            # Процесс доработает задачу в фоне, но ответ уже не ждём
+            self.timeouts += 1
+            metrics.observe_stage("render", time.monotonic() - started, "timeout")
+            raise RenderTimeout(f"{engine}: рендер дольше {timeout or self.timeout}с")
+        except BrokenProcessPool:
+            self.failed += 1
+            metrics.observe_stage("render", time.monotonic() - started, "error")
+            self._restart()
+            raise
+        except Exception:
+            self.failed += 1
+            metrics.observe_stage("render", time.monotonic() - started, "error")
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def _account(self, job):
+        """Занятость воркера — время самого рендера в нём, без ожидания в очереди. Считается по
+        завершении задачи, даже если её ответ уже не ждут после таймаута"""
+        if not job.cancelled() and job.exception() is None:
+            self.busy_seconds += sum(job.result()[1].values())
+
+    @property
+    def queued(self) -> int:
+        """Задачи, ждущие свободного воркера"""
+        return max(0, self.in_flight - self.workers)
+
+    def is_full(self) -> bool:
+        return bool(self.max_queue) and self.queued >= self.max_queue
+
+    def queue_position(self) -> int:
+        """Место новой задачи в очереди (0 — воркер свободен сразу)"""
+        return max(0, self.in_flight - self.workers + 1)
+
+    def utilization(self) -> float:
+        """Доля времени, которую воркеры были заняты, с момента запуска"""
+        if self._started_at is None:
+            return 0.0
+        elapsed = time.monotonic() - self._started_at
+        if elapsed <= 0:
+            return 0.0
+        return min(1.0, self.busy_seconds / (elapsed * self.workers))
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "utilization": round(self.utilization(), 3),
+        }
+
+    def describe(self) -> str:
+        s = self.stats()
+        return (f"{s['mode']} x{s['workers']}, в работе: {s['in_flight']}, готово: {s['completed']}, "
+                f"ошибок: {s['failed']}, таймаутов: {s['timeouts']}, отклонено: {s['rejected']}, загрузка: {s['utilization']:.1%}")
@@ -0,0 +1,426 @@
+import contextlib
+import functools
+import io
+import logging
+import random
+import threading
+import time
+from PIL import Image, ImageDraw, ImageFilter, ImageOps
+
+try:
+    import numpy as np
+except ImportError:  # без NumPy шакализация идёт по старому пути на Pillow
+    np = None
+
+from encoder import encode_image
+from templates import registry as template_registry
+from decode import decode_image, open_image, load_rgb, ImageTooLarge
+from fonts import registry as font_registry, get_font, WATERMARK_FONT, WATERMARK_FONT_SIZE
+from text_stroke import draw_outlined_text
+from text_layout import fit_text, wrap_text, line_width
+
+logger = logging.getLogger(__name__)
+
+STANDARD = 512  # сторона фото в демотиваторе
+WATERMARK_TEXT = "@memfy_bot"
+
+# Варианты настроек мастера (кнопки бота) — их же перебирает bench.py
+FONT_SIZES = {
+    "size_small": {"top": 30, "bottom": 20},
+    "size_medium": {"top": 40, "bottom": 28},
+    "size_large": {"top": 50, "bottom": 35},
+    "size_xlarge": {"top": 60, "bottom": 40},
+}
+BORDER_THICKNESS = {"thickness_thin": 4, "thickness_normal": 10, "thickness_thick": 20, "thickness_xthick": 30}
+# Шакализация: (доля разрешения, бит на канал, качество JPEG)
+SHAKAL_LEVELS = {
+    'mild': (0.8, 6, 50), 'light': (0.6, 5, 35), 'medium': (0.35, 4, 20),
+    'hard': (0.14, 3, 8), 'extreme': (0.05, 2, 5),
+}
+SHAKAL_TITLES = {'mild': "Мягкая", 'light': "Лёгкая", 'medium': "Средняя", 'hard': "Жёсткая", 'extreme': "Экстремальная"}
+SHAKAL_COLORS = 64     # цветов в палитре после квантования
+SHEET_TILE = 400       # сторона ячейки превью всех уровней
+
+
+# === ЗАМЕР ЭТАПОВ ВНУТРИ ВОРКЕРА ===
+# Декодирование и кодирование JPEG меряются отдельно от самого рендера (см. timed_render_job)
+_stage_times = threading.local()
+
+
+@contextlib.contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        times = getattr(_stage_times, "times", None)
+        if times is not None:
+            times[stage] = times.get(stage, 0.0) + time.perf_counter() - started
+
+
+# === ЗАГОТОВКИ (кэш на процесс) ===
+# Пространство вариантов крошечное: цвета водяного знака, фоны × рамки × типы демотиватора.
+# Заготовки общие — рендер их только копирует или вклеивает, не изменяя.
+@functools.lru_cache(maxsize=16)
+def watermark_sprite(color: tuple) -> Image.Image:
+    """RGBA-спрайт водяного знака заданного цвета"""
+    wm_font = get_font(WATERMARK_FONT, WATERMARK_FONT_SIZE)
+    tw, th = wm_font.getbbox(WATERMARK_TEXT)[2:]
+    wm_img = Image.new('RGBA', (tw + 10, th + 5), (0, 0, 0, 0))
+    ImageDraw.Draw(wm_img).text((5, 0), WATERMARK_TEXT, fill=color, font=wm_font)
+    return wm_img
+
+
+def paste_watermark(image: Image.Image, color: tuple, margin: int, far: int):
+    """Вклеивает водяной знак в случайный угол (отступ margin, с дальних сторон — far)"""
+    wm_img = watermark_sprite(color)
+    tw, th = wm_img.width - 10, wm_img.height - 5
+    w, h = image.size
+    corners = [(margin, margin), (w - tw - far, margin), (margin, h - th - far), (w - tw - far, h - th - far)]
+    image.paste(wm_img, random.choice(corners), wm_img)
+
+
+@functools.lru_cache(maxsize=64)
+def demotivator_template(bg_color: tuple, border_thickness: int, demotivator_type: str) -> Image.Image:
+    """Холст демотиватора: фон + рамка вокруг места под фото"""
+    is_black_bg = bg_color == (0, 0, 0)
+    border_color = (255, 255, 255) if is_black_bg else (100, 100, 100)
+    padding = 30
+    total_pad = padding + border_thickness
+    top_space = 80 if demotivator_type == "type_normal" else 20
+    dw = STANDARD + total_pad * 2
+    dh = STANDARD + total_pad * 2 + (200 if demotivator_type == "type_normal" else 120)
+
+    canvas = Image.new('RGB', (dw, dh), bg_color)
+    # Рамка одним прямоугольником толщиной border_thickness (внутренний край — как раньше)
+    x1, y1 = total_pad - border_thickness, total_pad + top_space - border_thickness
+    x2, y2 = total_pad + STANDARD + border_thickness - 1, total_pad + STANDARD + top_space + border_thickness - 1
+    if border_thickness > 0:
+        ImageDraw.Draw(canvas).rectangle(
+            [x1 - border_thickness + 1, y1 - border_thickness + 1, x2 + border_thickness - 1, y2 + border_thickness - 1],
+            outline=border_color, width=border_thickness
+        )
+    return canvas
+
+
+# === ИСХОДНИК: ФОТО ИЛИ ШАБЛОН ===
+def load_source(photo_bytes: io.BytesIO, template: str = None, target_size: tuple = None) -> Image.Image:
+    """Фото пользователя или шаблон из memes/ — без скачивания и декодирования (копия общего буфера)"""
+    if template:
+        return template_registry.get(template).copy()
+    with timed("decode"):
+        return decode_image(photo_bytes, target_size=target_size)
+
+
+# === КЛАССИЧЕСКИЙ МЕМ (для фото) ===
+def draw_classic_captions(image: Image.Image, top_text: str, bottom_text: str, font_key: str = "impact",
+                          outline_width: int = 2, min_font_size: int = 40):
+    """Верхняя и нижняя подписи с обводкой (на RGB-фото или на прозрачном RGBA-слое)"""
+    w, h = image.size
+    # Верх и низ одним размером: наибольший, при котором обе подписи влезают в свою треть
+    font_size = max(min_font_size, int(w / 20))
+    box_w, box_h = w - 40, (h - 20) // 3
+    for text in (top_text, bottom_text):
+        if text:
+            font_size = fit_text(text, font_key, box_w, box_h, font_size, line_spacing=1.3)[1]
+    font = get_font(font_key, font_size)
+
+    if top_text:
+        lines = wrap_text(top_text, font, box_w)
+        y = 10
+        for line in lines:
+            tw = line_width(font, line)
+            draw_outlined_text(image, ((w - tw) // 2, y), line, font, width=outline_width)
+            y += int(font_size * 1.3)
+
+    if bottom_text:
+        lines = wrap_text(bottom_text, font, box_w)
+        y = h - len(lines) * int(font_size * 1.3) - 10
+        for line in lines:
+            tw = line_width(font, line)
+            draw_outlined_text(image, ((w - tw) // 2, y), line, font, width=outline_width)
+            y += int(font_size * 1.3)
+
+
+def create_classic_meme(photo_bytes: io.BytesIO, top_text: str, bottom_text: str, font_key: str = "impact",
+                        outline_width: int = 2, min_font_size: int = 40, output: str = "jpeg",
+                        template: str = None) -> io.BytesIO:
+    image = load_source(photo_bytes, template)
+    draw_classic_captions(image, top_text, bottom_text, font_key, outline_width, min_font_size)
+
+    # Водяной знак
+    paste_watermark(image, (255, 255, 255, 128), 10, 20)
+
+    with timed("encode"):
+        return encode_image(image, output)
+
+
+# === ДЕМОТИВАТОР (с адаптивной обводкой и водяным знаком) ===
+def create_demotivator(photo_bytes: io.BytesIO, top_text: str, bottom_text: str,
+                      font_size: dict = None, font_key: str = "roboto",
+                      demotivator_type: str = "type_normal", font_color: str = "white",
+                      border_thickness: int = 10, bg_color: tuple = (0, 0, 0),
+                      output: str = "jpeg", template: str = None) -> io.BytesIO:
+    if font_size is None:
+        font_size = {"top": 40, "bottom": 28}
+    top_fs, bottom_fs = font_size["top"], font_size["bottom"]
+
+    color_map = {
+        "red": (255, 0, 0), "white": (255, 255, 255), "yellow": (255, 255, 0), "orange": (255, 165, 0),
+        "blue": (0, 0, 255), "green": (0, 255, 0), "purple": (128, 0, 128), "brown": (165, 42, 42),
+        "black": (0, 0, 0), "gray": (128, 128, 128), "pink": (255, 192, 203),
+    }
+    text_color = color_map.get(font_color, (255, 255, 255))
+
+    # Адаптивные цвета
+    is_black_bg = tuple(bg_color) == (0, 0, 0)
+    watermark_color = (255, 255, 255, 180) if is_black_bg else (50, 50, 50, 180)
+
+    image = load_source(photo_bytes, template, target_size=(STANDARD, STANDARD))
+    if image.size != (STANDARD, STANDARD):
+        image = image.resize((STANDARD, STANDARD), Image.Resampling.LANCZOS)
+    w, h = STANDARD, STANDARD
+
+    padding = 30
+    total_pad = padding + border_thickness
+    top_space = 80 if demotivator_type == "type_normal" else 20
+    canvas = demotivator_template(tuple(bg_color), border_thickness, demotivator_type).copy()
+    dw, dh = canvas.size
+    canvas.paste(image, (total_pad, total_pad + top_space))
+    draw = ImageDraw.Draw(canvas)
+    y1 = total_pad + top_space - border_thickness  # верх рамки
+
+    # Текст: размеры из size_map — максимум, длинные подписи уменьшаются до влезания
+    text_w = dw - 100
+    if top_text and demotivator_type == "type_normal":
+        y = 20
+        top_h = y1 - border_thickness - y - 5
+        font_large, top_fs, lines = fit_text(top_text, font_key, text_w, top_h, top_fs, line_spacing=1.25)
+        for line in lines:
+            tw = line_width(font_large, line)
+            draw.text(((dw - tw) // 2, y), line, fill=text_color, font=font_large)
+            y += int(top_fs * 1.25)
+
+    if bottom_text:
+        y = total_pad + h + top_space + border_thickness + 30
+        bottom_h = dh - y - 10
+        font_small, bottom_fs, lines = fit_text(bottom_text, font_key, text_w, bottom_h, bottom_fs, line_spacing=1.25)
+        for line in lines:
+            tw = line_width(font_small, line)
+            draw.text(((dw - tw) // 2, y), line, fill=text_color, font=font_small)
+            y += int(bottom_fs * 1.25)
+
+    # Водяной знак
+    paste_watermark(canvas, watermark_color, 15, 25)
+
+    with timed("encode"):
+        return encode_image(canvas, output)
+
+
+# === ШАКАЛИЗАЦИЯ (без глитча) ===
+def _shakal_size(size: tuple, intensity: str) -> tuple:
+    w, h = size
+    down = SHAKAL_LEVELS.get(intensity, SHAKAL_LEVELS['hard'])[0]
+    return max(2, int(w * down)), max(2, int(h * down))
+
+
+def _quantize(pixels, colors: int):
+    """Median cut по уникальным цветам с учётом частоты, результат пишется в pixels (N×3) на месте.
+    Возвращает палитру (K×3, K ≤ colors)"""
+    packed = (pixels[:, 0].astype(np.int32) << 16) | (pixels[:, 1].astype(np.int32) << 8) | pixels[:, 2]
+    unique, inverse, counts = np.unique(packed, return_inverse=True, return_counts=True)
+    rgb = np.stack([(unique >> 16) & 255, (unique >> 8) & 255, unique & 255], axis=1).astype(np.uint8)
+    if len(unique) <= colors:
+        return rgb
+
+    def describe(box):
+        # Разброс по каналам и «вес» коробки: разброс × число пикселей
+        span = rgb[box].max(axis=0) - rgb[box].min(axis=0)
+        return box, span, int(span.max()) * int(counts[box].sum())
+
+    boxes = [describe(np.arange(len(unique)))]
+    while len(boxes) < colors:
+        i = max(range(len(boxes)), key=lambda k: boxes[k][2])
+        box, span, score = boxes[i]
+        if score == 0:
+            break
+        del boxes[i]
+        channel = int(np.argmax(span))
+        box = box[np.argsort(rgb[box, channel], kind='stable')]
+        cut = int(np.searchsorted(np.cumsum(counts[box]), counts[box].sum() / 2))
+        cut = min(max(cut, 1), len(box) - 1)
+        boxes += [describe(box[:cut]), describe(box[cut:])]
+    mapped = np.empty_like(rgb)
+    for box, _, _ in boxes:
+        weights = counts[box][:, None]
+        mapped[box] = (rgb[box] * weights).sum(axis=0) // weights.sum()
+    pixels[:] = mapped[inverse.ravel()]
+    return np.array([mapped[box[0]] for box, _, _ in boxes], dtype=np.uint8)
+
+
+def _nearest_colors(a, palette):
+    """Каждый пиксель (H×W×3) → ближайший цвет палитры. Ближайший ищется один раз на ячейку
+    сетки 32³, пиксель берёт ответ своей ячейки — без перебора палитры на каждый пиксель"""
+    centers = np.arange(4, 256, 8, dtype=np.float32)
+    grid = np.stack(np.meshgrid(centers, centers, centers, indexing='ij'), axis=-1).reshape(-1, 3)
+    colors = palette.astype(np.float32)
+    # |g - p|² = |g|² - 2·g·p + |p|²; |g|² для выбора p не важен — остаётся одно матричное умножение
+    lut = ((colors ** 2).sum(axis=1) - 2 * grid @ colors.T).argmin(axis=1)
+    # Цвет палитры всегда остаётся собой (по центру ячейки ближе мог оказаться соседний)
+    lut[_cells(palette)] = np.arange(len(palette))
+    return palette[lut[_cells(a)]]
+
+
+def _cells(a):
+    cell = (a >> 3).astype(np.uint16)
+    return (cell[..., 0] << 10) | (cell[..., 1] << 5) | cell[..., 2]
+
+
+def shakalize_pixels(small: Image.Image, bits: int, colors: int = SHAKAL_COLORS) -> tuple:
+    """Постеризация, автоконтраст и палитра — на одном массиве уменьшенного кадра.
+
+    Все шаги поканальные или поцветные, поэтому их можно делать до увеличения NEAREST:
+    результат тот же, а пикселей в десятки раз меньше. Возвращает (кадр, палитра).
+    """
+    a = np.array(small, dtype=np.uint8)
+    a &= 0xFF & ~((1 << (8 - bits)) - 1)
+    for c in range(3):
+        channel = a[..., c]
+        lo, hi = int(channel.min()), int(channel.max())
+        if hi > lo:
+            lut = ((np.arange(256, dtype=np.int32) - lo) * 255 // (hi - lo)).clip(0, 255).astype(np.uint8)
+            channel[...] = lut[channel]
+    palette = _quantize(a.reshape(-1, 3), colors)
+    return Image.fromarray(a, 'RGB'), palette
+
+
+def _shakalize_numpy(im: Image.Image, size: tuple, intensity: str) -> Image.Image:
+    """Кадр в исходном размере: мелкая копия → эффекты на массиве → NEAREST вверх → размытие →
+    обратно в палитру. Размытие даёт промежуточные цвета на стыках блоков; как и в пути на Pillow,
+    палитра применяется последней, чтобы в кадре осталось не больше SHAKAL_COLORS цветов."""
+    _, bits, _ = SHAKAL_LEVELS.get(intensity, SHAKAL_LEVELS['hard'])
+    small = im.resize(_shakal_size(size, intensity), Image.Resampling.NEAREST)
+    small, palette = shakalize_pixels(small, bits)
+    blur = small.resize(size, Image.Resampling.NEAREST).filter(ImageFilter.GaussianBlur(1))
+    return Image.fromarray(_nearest_colors(np.asarray(blur), palette), 'RGB')
+
+
+def _shakalize_pillow(im: Image.Image, size: tuple, intensity: str) -> Image.Image:
+    """Старый путь без NumPy: полноразмерные промежуточные кадры и лишний цикл JPEG"""
+    _, bits, qual = SHAKAL_LEVELS.get(intensity, SHAKAL_LEVELS['hard'])
+    small = im.resize(_shakal_size(size, intensity), Image.Resampling.NEAREST)
+    pixel = small.resize(size, Image.Resampling.NEAREST)
+    poster = ImageOps.posterize(pixel, bits)
+    blur = poster.filter(ImageFilter.GaussianBlur(1))
+    final = ImageOps.autocontrast(blur)
+    out = io.BytesIO()
+    final.save(out, format='JPEG', quality=qual)
+    return Image.open(out).convert('P', palette=Image.ADAPTIVE, colors=SHAKAL_COLORS).convert('RGB')
+
+
+def shakalize_image(photo_bytes: io.BytesIO, intensity: str = 'hard') -> io.BytesIO:
+    try:
+        im = open_image(photo_bytes)
+        qual = SHAKAL_LEVELS.get(intensity, SHAKAL_LEVELS['hard'])[2]
+        size = im.size
+        # Всё равно пикселизуем до nw×nh — декодируем сразу близко к этому размеру
+        with timed("decode"):
+            im = load_rgb(im, _shakal_size(size, intensity))
+        if np is not None:
+            final = _shakalize_numpy(im, size, intensity)
+        else:
+            final = _shakalize_pillow(im, size, intensity)
+        final_out = io.BytesIO()
+        with timed("encode"):
+            final.save(final_out, format='JPEG', quality=max(2, qual))
+        final_out.seek(0)
+        return final_out
+    except ImageTooLarge:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка в shakalize_image: {e}", exc_info=True)
+        # Возвращаем оригинал в случае ошибки
+        photo_bytes.seek(0)
+        return photo_bytes
+
+
+def shakalize_contact_sheet(photo_bytes: io.BytesIO) -> io.BytesIO:
+    """Превью всех уровней на одной картинке: одно декодирование, ячейки 3×2 (шестая — оригинал)"""
+    with timed("decode"):
+        tile = decode_image(photo_bytes, target_size=(SHEET_TILE, SHEET_TILE))
+    tile.thumbnail((SHEET_TILE, SHEET_TILE), Image.Resampling.LANCZOS)
+    tw, th = tile.size
+    label_h = 36
+    font = get_font(WATERMARK_FONT, 22)
+    sheet = Image.new('RGB', (tw * 3, (th + label_h) * 2), (0, 0, 0))
+    draw = ImageDraw.Draw(sheet)
+
+    cells = [(level, SHAKAL_TITLES[level]) for level in SHAKAL_LEVELS] + [(None, "Оригинал")]
+    for i, (level, title) in enumerate(cells):
+        x, y = (i % 3) * tw, (i // 3) * (th + label_h)
+        if level is None:
+            cell = tile
+        else:
+            cell = _shakalize_numpy(tile, tile.size, level) if np is not None else _shakalize_pillow(tile, tile.size, level)
+            # Артефакты JPEG — часть эффекта: у каждой ячейки своё качество
+            buf = io.BytesIO()
+            cell.save(buf, format='JPEG', quality=SHAKAL_LEVELS[level][2])
+            cell = Image.open(buf)
+        sheet.paste(cell, (x, y + label_h))
+        draw.text((x + tw // 2, y + label_h // 2), f"{i + 1}. {title}" if level else title,
+                  font=font, fill=(255, 255, 255), anchor="mm")
+
+    out = io.BytesIO()
+    with timed("encode"):
+        sheet.save(out, format='JPEG', quality=90)
+    out.seek(0)
+    return out
+
+
+# === УМЕНЬШЕННАЯ КОПИЯ ДЛЯ ПРЕВЬЮ ===
+def make_thumbnail(photo_bytes: io.BytesIO, side: int = 256) -> io.BytesIO:
+    with timed("decode"):
+        image = decode_image(photo_bytes, target_size=(side, side))
+    image.thumbnail((side, side), Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    with timed("encode"):
+        image.save(out, format='JPEG', quality=85)
+    out.seek(0)
+    return out
+
+
+# === ТОЧКА ВХОДА ДЛЯ ВОРКЕРОВ ===
+# Через границу процесса передаются только байты и простые параметры.
+RENDERERS = {
+    "classic": create_classic_meme,
+    "demotivator": create_demotivator,
+    "shakalize": shakalize_image,
+    "shakalize_sheet": shakalize_contact_sheet,
+    "thumbnail": make_thumbnail,
+}
+
+
+def render_job(engine: str, data: bytes, params: dict) -> bytes:
+    """Выполняет рендер в воркере: байты фото на вход, байты результата на выход"""
+    if engine == "animated":
+        # Конвейер GIF/видео (ffmpeg) подгружаем только когда он нужен
+        from animated import create_animated_meme
+        renderer = create_animated_meme
+    else:
+        renderer = RENDERERS[engine]
+    result = renderer(io.BytesIO(data), **params)
+    return result.getvalue()
+
+
+def timed_render_job(engine: str, data: bytes, params: dict) -> tuple:
+    """render_job + длительности этапов в воркере и обращения к кэшу шрифтов воркера:
+    (байты, {"decode": с, "render": с, "encode": с}, {"hit": n, "miss": n})"""
+    _stage_times.times = times = {}
+    hits, misses = font_registry.hits, font_registry.misses
+    started = time.perf_counter()
+    try:
+        result = render_job(engine, data, params)
+    finally:
+        _stage_times.times = None
+    times["render"] = time.perf_counter() - started - sum(times.values())
+    return result, times, {"hit": font_registry.hits - hits, "miss": font_registry.misses - misses}
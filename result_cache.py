@@ -0,0 +1,92 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(file_unique_id: str, engine: str, params: dict) -> str:
+    """Ключ результата: исходное фото + рендер + все параметры стиля и текст"""
+    payload = json.dumps([file_unique_id, engine, params], sort_keys=True, ensure_ascii=False, default=list)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# === КЭШ ГОТОВЫХ МЕМОВ (file_id Telegram) ===
+class ResultCache:
+    """LRU «ключ → file_id отправленного результата», опционально с SQLite на диске.
+
+    Попадание позволяет переслать уже загруженное фото по file_id:
+    без скачивания, декодирования, рендера и загрузки.
+    """
+
+    def __init__(self, max_entries: int = 5000, db_path: str = None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str):
+        try:
+            self._db = sqlite3.connect(db_path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, file_id TEXT NOT NULL, used REAL NOT NULL)"
+            )
+            rows = self._db.execute(
+                "SELECT key, file_id FROM results ORDER BY used DESC LIMIT ?", (self.max_entries,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Кэш результатов без диска: {e}")
+            self._db = None
+            return
+        for key, file_id in reversed(rows):
+            self._entries[key] = file_id
+        logger.info(f"Кэш результатов: загружено {len(rows)} записей из {db_path}")
+
+    def get(self, key: str):
+        file_id = self._entries.get(key)
+        if file_id is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return file_id
+
+    def put(self, key: str, file_id: str):
+        self._entries[key] = file_id
+        self._entries.move_to_end(key)
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False)[0])
+        if self._db is not None:
+            try:
+                with self._db:
+                    self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, file_id, time.time()))
+                    self._db.executemany("DELETE FROM results WHERE key = ?", [(k,) for k in evicted])
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось сохранить результат в кэш: {e}")
+
+    def discard(self, key: str):
+        """Убирает запись (например, Telegram больше не принимает этот file_id)"""
+        self._entries.pop(key, None)
+        if self._db is not None:
+            try:
+                with self._db:
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
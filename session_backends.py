@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, unquote
+
+logger = logging.getLogger(__name__)
+
+
+# === ОБЩИЕ ХРАНИЛИЩА СЕССИЙ ===
+# Интерфейс: async load(key) → bytes | None, async save(key, value, ttl), async delete(key), close().
+# Значение — готовая сериализованная сессия (см. SessionStore), один ключ на пользователя.
+
+class MemoryBackend:
+    """Словарь в процессе: для одного экземпляра и для проверки без внешнего хранилища"""
+
+    def __init__(self):
+        self._data = {}  # ключ → (значение, истекает)
+
+    async def load(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] < time.time():
+            del self._data[key]
+            return None
+        return item[0]
+
+    async def save(self, key: str, value: bytes, ttl: float):
+        self._data[key] = (value, time.time() + ttl)
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def close(self):
+        self._data.clear()
+
+
+class SQLiteBackend:
+    """Файл SQLite в режиме WAL: экземпляры на одном хосте/томе делят сессии, переживают перезапуск.
+
+    Запросы блокирующие (пока другой экземпляр держит блокировку записи — до timeout секунд),
+    поэтому выполняются в отдельном потоке, а не в event loop; один поток — одно соединение
+    и запросы строго по очереди.
+    """
+
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+        self._last_purge = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions-sqlite")
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _load(self, key: str):
+        row = self._db.execute("SELECT value FROM sessions WHERE key = ? AND expires > ?",
+                               (key, time.time())).fetchone()
+        return bytes(row[0]) if row else None
+
+    def _save(self, key: str, value: bytes, ttl: float):
+        now = time.time()
+        self._db.execute("INSERT OR REPLACE INTO sessions (key, value, expires) VALUES (?, ?, ?)",
+                         (key, value, now + ttl))
+        if now - self._last_purge > self.PURGE_INTERVAL:
+            self._last_purge = now
+            self._db.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+
+    def _delete(self, key: str):
+        self._db.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    async def load(self, key: str):
+        return await self._call(self._load, key)
+
+    async def save(self, key: str, value: bytes, ttl: float):
+        await self._call(self._save, key, value, ttl)
+
+    async def delete(self, key: str):
+        await self._call(self._delete, key)
+
+    def close(self):
+        # Дожидаемся запросов в очереди потока, потом закрываем соединение
+        self._executor.shutdown(wait=True)
+        self._db.close()
+
+
+class RedisError(Exception):
+    """Ответ -ERR от сервера Redis"""
+
+
+class RedisBackend:
+    """Минимальный клиент протокола Redis (RESP) на asyncio: GET / SET PX / DEL, без зависимостей.
+
+    Одно соединение; команды идут по очереди под блокировкой. При обрыве — одна попытка
+    переподключиться. URL: redis://[:пароль@]хост:порт[/номер базы]
+    """
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader = self._writer = None
+        self._lock = asyncio.Lock()
+
+    # --- протокол ---
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis закрыл соединение")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RedisError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            data = await self._reader.readexactly(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(body)
+            return None if size < 0 else [await self._read_reply() for _ in range(size)]
+        raise ConnectionError(f"Непонятный ответ Redis: {line[:40]!r}")
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        if self.password:
+            await self._send("AUTH", self.password)
+        if self.db:
+            await self._send("SELECT", self.db)
+
+    async def _send(self, *args):
+        self._writer.write(self._encode(args))
+        await self._writer.drain()
+        return await asyncio.wait_for(self._read_reply(), self.timeout)
+
+    async def command(self, *args):
+        async with self._lock:
+            for attempt in (0, 1):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._send(*args)
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    self._disconnect()
+                    if attempt:
+                        raise
+
+    def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    # --- интерфейс хранилища ---
+    async def load(self, key: str):
+        return await self.command("GET", key)
+
+    async def save(self, key: str, value: bytes, ttl: float):
+        await self.command("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str):
+        await self.command("DEL", key)
+
+    def close(self):
+        self._disconnect()
+
+
+def create_backend(kind: str, sqlite_path: str = None, redis_url: str = None):
+    """SESSION_BACKEND → хранилище; пусто/"local" — только память процесса (без сериализации)"""
+    kind = (kind or "local").lower()
+    if kind == "local":
+        return None
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(sqlite_path or "sessions.db")
+    if kind == "redis":
+        return RedisBackend(redis_url or "redis://127.0.0.1:6379/0")
+    raise ValueError(f"Неизвестное хранилище сессий: {kind}")
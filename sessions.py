@@ -0,0 +1,314 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    __slots__ = ("data", "messages", "photo", "photo_ref", "photo_path", "photo_size", "thumb", "thumb_ref",
+                 "touched", "snapshot")
+
+    def __init__(self):
+        self.data = {}
+        self.messages = []
+        self.photo = None       # байты фото в памяти
+        self.photo_ref = None   # file_unique_id, которому принадлежат байты
+        self.photo_path = None  # или путь к файлу, если фото выгружено на диск
+        self.photo_size = 0
+        self.thumb = None       # уменьшенная копия для превью мастера (только в памяти)
+        self.thumb_ref = None   # file_unique_id размера, из которого она сделана
+        self.touched = time.monotonic()
+        self.snapshot = None    # сериализованная сессия, как она лежит в общем хранилище
+
+
+# === ХРАНИЛИЩЕ СЕССИЙ ===
+class SessionStore:
+    """Сессии мастера по user_id: TTL на запись, общий бюджет байт на фото, вытеснение по LRU.
+
+    Холодные фото при превышении бюджета выгружаются во временную папку (если включено),
+    и только потом вытесняются сессии целиком. Уменьшенные копии для превью считаются в том же
+    бюджете; у холодных сессий они просто выбрасываются — их легко сделать заново.
+
+    С общим хранилищем (backend, см. session_backends) локальные записи — рабочая копия:
+    load() перед апдейтом подтягивает сессию одним запросом, save() после апдейта пишет её
+    одним запросом и только если она изменилась. Фото в хранилище не попадает — только
+    ссылки (file_id); байты остаются локальным кэшем, привязанным к file_unique_id.
+    """
+
+    def __init__(self, ttl: float = 1800, max_bytes: int = 256 * 1024 * 1024,
+                 max_entries: int = 10000, spill: bool = True, spill_dir: str = None, backend=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.spill = spill
+        self._spill_dir = spill_dir
+        self._entries = OrderedDict()
+        self._last_sweep = time.monotonic()
+        self.bytes_in_memory = 0
+        self.bytes_on_disk = 0
+        self.expired = 0
+        self.evicted = 0
+        self.spilled = 0
+        self.backend_reads = 0
+        self.backend_writes = 0
+        self.backend_errors = 0
+
+    # --- доступ ---
+    def _entry(self, user_id: int, create: bool = True):
+        self._sweep()
+        entry = self._entries.get(user_id)
+        if entry is not None and time.monotonic() - entry.touched > self.ttl:
+            self._drop(user_id)
+            self.expired += 1
+            entry = None
+        if entry is None:
+            if not create:
+                return None
+            entry = self._entries[user_id] = _Entry()
+            self._enforce_limits()
+        entry.touched = time.monotonic()
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def get(self, user_id: int) -> dict:
+        """Данные мастера пользователя (создаются при первом обращении)"""
+        return self._entry(user_id).data
+
+    def peek(self, user_id: int):
+        """Данные мастера или None — без создания сессии (для чужих сообщений в группах)"""
+        entry = self._entry(user_id, create=False)
+        return entry.data if entry is not None else None
+
+    def reset(self, user_id: int) -> dict:
+        """Сбрасывает данные мастера и фото; список сообщений сохраняется"""
+        entry = self._entry(user_id)
+        self._release_photo(entry)
+        self._release_thumb(entry)
+        entry.data = {}
+        return entry.data
+
+    def messages(self, user_id: int) -> list:
+        """Id служебных сообщений, которые удалим после генерации"""
+        return self._entry(user_id).messages
+
+    def take_messages(self, user_id: int) -> list:
+        """Забирает и очищает список сообщений"""
+        entry = self._entry(user_id, create=False)
+        if entry is None:
+            return []
+        ids, entry.messages = entry.messages, []
+        return ids
+
+    # --- общее хранилище ---
+    @staticmethod
+    def _serialize(entry: _Entry) -> bytes:
+        return json.dumps({"data": entry.data, "messages": entry.messages}, ensure_ascii=False,
+                          sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+    async def load(self, user_id: int):
+        """Подтягивает сессию из общего хранилища перед обработкой апдейта (один запрос)"""
+        if self.backend is None:
+            return
+        try:
+            blob = await self.backend.load(f"memfy:session:{user_id}")
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Сессия {user_id} не прочитана из хранилища, работаем с локальной: {e}")
+            return
+        self.backend_reads += 1
+        entry = self._entries.get(user_id)
+        if blob is None:
+            # Истекла или завершена на другом экземпляре — локальная копия устарела
+            if entry is not None and entry.snapshot is not None:
+                self._drop(user_id)
+            return
+        if entry is not None and entry.snapshot == blob:
+            return
+        record = json.loads(blob)
+        entry = self._entry(user_id)
+        # Локальные байты фото и превью привязаны к file_unique_id и сами не отдадутся для другого фото
+        entry.data = record["data"]
+        entry.messages = record["messages"]
+        entry.snapshot = blob
+
+    async def save(self, user_id: int):
+        """Пишет сессию в общее хранилище после апдейта — только если она изменилась"""
+        if self.backend is None:
+            return
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        blob = self._serialize(entry)
+        if blob == entry.snapshot:
+            return
+        key = f"memfy:session:{user_id}"
+        try:
+            if entry.data or entry.messages:
+                await self.backend.save(key, blob, self.ttl)
+            else:
+                await self.backend.delete(key)
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Сессия {user_id} не записана в хранилище: {e}")
+            return
+        self.backend_writes += 1
+        entry.snapshot = blob
+
+    # --- фото ---
+    def set_photo(self, user_id: int, data: bytes, ref: str = None):
+        entry = self._entry(user_id)
+        self._release_photo(entry)
+        entry.photo = data
+        entry.photo_ref = ref
+        entry.photo_size = len(data)
+        self.bytes_in_memory += entry.photo_size
+        self._enforce_limits(keep=user_id)
+
+    def get_photo(self, user_id: int, ref: str = None):
+        """Байты фото (подгружаются с диска, если были выгружены) или None.
+        ref — file_unique_id: байты другого фото не возвращаются"""
+        entry = self._entry(user_id, create=False)
+        if entry is None or (ref is not None and entry.photo_ref != ref):
+            return None
+        if entry.photo is None and entry.photo_path is not None:
+            try:
+                with open(entry.photo_path, 'rb') as f:
+                    return f.read()
+            except OSError as e:
+                logger.warning(f"Не удалось прочитать выгруженное фото: {e}")
+                self._release_photo(entry)
+                return None
+        return entry.photo
+
+    def pop_photo(self, user_id: int):
+        """Освобождает фото и его превью-копию"""
+        entry = self._entry(user_id, create=False)
+        if entry is not None:
+            self._release_photo(entry)
+            self._release_thumb(entry)
+
+    # --- превью-копия фото ---
+    def set_thumb(self, user_id: int, data: bytes, ref: str = None):
+        entry = self._entry(user_id)
+        self._release_thumb(entry)
+        entry.thumb = data
+        entry.thumb_ref = ref
+        self.bytes_in_memory += len(data)
+        self._enforce_limits(keep=user_id)
+
+    def get_thumb(self, user_id: int, ref: str = None):
+        """Превью-копия или None; ref — file_unique_id размера, из которого она сделана"""
+        entry = self._entry(user_id, create=False)
+        if entry is None or (ref is not None and entry.thumb_ref != ref):
+            return None
+        return entry.thumb
+
+    # --- вытеснение ---
+    def _release_photo(self, entry: _Entry):
+        if entry.photo is not None:
+            self.bytes_in_memory -= entry.photo_size
+        if entry.photo_path is not None:
+            self.bytes_on_disk -= entry.photo_size
+            try:
+                os.remove(entry.photo_path)
+            except OSError:
+                pass
+        entry.photo = entry.photo_path = entry.photo_ref = None
+        entry.photo_size = 0
+
+    def _release_thumb(self, entry: _Entry):
+        if entry.thumb is not None:
+            self.bytes_in_memory -= len(entry.thumb)
+        entry.thumb = entry.thumb_ref = None
+
+    def _drop(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._release_photo(entry)
+            self._release_thumb(entry)
+
+    def _spill(self, entry: _Entry) -> bool:
+        if not self.spill:
+            return False
+        try:
+            if self._spill_dir is None:
+                self._spill_dir = tempfile.mkdtemp(prefix="memfy_sessions_")
+            os.makedirs(self._spill_dir, exist_ok=True)
+            fd, path = tempfile.mkstemp(dir=self._spill_dir, suffix=".img")
+            with os.fdopen(fd, 'wb') as f:
+                f.write(entry.photo)
+        except OSError as e:
+            logger.warning(f"Не удалось выгрузить фото на диск: {e}")
+            return False
+        entry.photo = None
+        entry.photo_path = path
+        self.bytes_in_memory -= entry.photo_size
+        self.bytes_on_disk += entry.photo_size
+        self.spilled += 1
+        return True
+
+    def _enforce_limits(self, keep: int = None):
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.evicted += 1
+        if self.bytes_in_memory <= self.max_bytes:
+            return
+        # Сначала выгружаем холодные фото на диск (превью-копии выбрасываем), от самых старых
+        for user_id, entry in self._entries.items():
+            if self.bytes_in_memory <= self.max_bytes:
+                return
+            if user_id != keep:
+                self._release_thumb(entry)
+                if entry.photo is not None:
+                    self._spill(entry)
+        # Не помогло — вытесняем сессии целиком
+        while self.bytes_in_memory > self.max_bytes and len(self._entries) > 1:
+            user_id = next(iter(self._entries))
+            if user_id == keep:
+                self._entries.move_to_end(user_id)
+                user_id = next(iter(self._entries))
+            self._drop(user_id)
+            self.evicted += 1
+
+    def _sweep(self):
+        # Полный проход по TTL не чаще раза в минуту
+        now = time.monotonic()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        stale = [uid for uid, e in self._entries.items() if now - e.touched > self.ttl]
+        for user_id in stale:
+            self._drop(user_id)
+        self.expired += len(stale)
+
+    def close(self):
+        """Удаляет выгруженные на диск фото и закрывает общее хранилище"""
+        if self.backend is not None:
+            self.backend.close()
+        for entry in self._entries.values():
+            self._release_photo(entry)
+            self._release_thumb(entry)
+        self._entries.clear()
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes_in_memory": self.bytes_in_memory,
+            "bytes_on_disk": self.bytes_on_disk,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "spilled": self.spilled,
+            "backend_reads": self.backend_reads,
+            "backend_writes": self.backend_writes,
+            "backend_errors": self.backend_errors,
+        }
+
+    def __len__(self):
+        return len(self._entries)
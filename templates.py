@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import tempfile
+import threading
+
+from PIL import Image
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# === ШАБЛОНЫ МЕМОВ (папка memes/ рядом с bot.py) ===
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memes")
+TEMPLATE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# Необязательный файл в memes/: {"имя шаблона": ["тег", ...]} — дополняет теги из имени файла
+TAGS_FILE = "tags.json"
+INDEX_FILE = "index.json"
+PIXELS_FILE = "pixels.bin"
+INDEX_VERSION = 1
+
+
+def name_tags(name: str) -> list:
+    """'drake_hotline-bling' → ['drake', 'hotline', 'bling']"""
+    return [t for t in re.split(r"[\s_\-.]+", name.lower()) if t]
+
+
+# === БИБЛИОТЕКА ШАБЛОНОВ ===
+class TemplateRegistry:
+    """Индекс шаблонов (имя, теги, размеры, хэш) и их пиксели в файле, отображённом в память.
+
+    При запуске memes/ сканируется; изменившиеся по размеру/времени файлы перечитываются,
+    уменьшаются до side и пишутся в pixels.bin как сырой RGB. Картинки отдаются через
+    Image.frombuffer поверх mmap без копирования — воркеры пула делят одни и те же страницы.
+    """
+
+    def __init__(self, template_dir: str = TEMPLATE_DIR, side: int = 512, cache_dir: str = None):
+        self.template_dir = template_dir
+        self.side = side
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "memfy_templates")
+        self._index = {}   # имя → запись индекса
+        self._images = {}  # имя → картинка поверх mmap
+        self._mmap = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    # --- индекс ---
+    def _scan(self) -> dict:
+        """Файлы шаблонов: имя → (путь, размер, mtime_ns)"""
+        try:
+            files = sorted(os.listdir(self.template_dir))
+        except OSError:
+            return {}
+        found = {}
+        for fname in files:
+            name, ext = os.path.splitext(fname)
+            if ext.lower() in TEMPLATE_EXTENSIONS:
+                st = os.stat(os.path.join(self.template_dir, fname))
+                found[name.lower()] = (fname, st.st_size, st.st_mtime_ns)
+        return found
+
+    def _read_tags(self) -> dict:
+        try:
+            with open(os.path.join(self.template_dir, TAGS_FILE), encoding='utf-8') as f:
+                return {k.lower(): [str(t).lower() for t in v] for k, v in json.load(f).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Теги шаблонов не прочитаны: {e}")
+            return {}
+
+    def _read_cached_index(self) -> dict:
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cached.get("version") != INDEX_VERSION or cached.get("side") != self.side:
+            return {}
+        return cached.get("templates", {})
+
+    def _build(self, found: dict, cached: dict) -> dict:
+        """Пересобирает pixels.bin: неизменённые шаблоны копируются из старого кэша, остальные декодируются"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        old_path = os.path.join(self.cache_dir, PIXELS_FILE)
+        tmp_path = old_path + f".{os.getpid()}.tmp"
+        index, rebuilt = {}, 0
+        old = open(old_path, 'rb') if cached and os.path.exists(old_path) else None
+        try:
+            with open(tmp_path, 'wb') as out:
+                for name, (fname, size, mtime) in found.items():
+                    entry = cached.get(name)
+                    if entry and old and entry["file"] == fname and entry["bytes"] == size and entry["mtime"] == mtime:
+                        old.seek(entry["offset"])
+                        pixels = old.read(entry["length"])
+                        entry = dict(entry)
+                    else:
+                        try:
+                            entry, pixels = self._decode(fname, size, mtime)
+                        except (OSError, Image.DecompressionBombError) as e:
+                            logger.warning(f"Шаблон НЕ загружен: {fname} ({e})")
+                            continue
+                        rebuilt += 1
+                    entry["offset"] = out.tell()
+                    out.write(pixels)
+                    index[name] = entry
+        finally:
+            if old is not None:
+                old.close()
+        os.replace(tmp_path, old_path)
+        payload = {"version": INDEX_VERSION, "side": self.side, "templates": index}
+        tmp_index = os.path.join(self.cache_dir, INDEX_FILE + f".{os.getpid()}.tmp")
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_index, os.path.join(self.cache_dir, INDEX_FILE))
+        logger.info(f"Кэш шаблонов пересобран: {len(index)} шаблонов, декодировано {rebuilt}")
+        return index
+
+    def _decode(self, fname: str, size: int, mtime: int) -> tuple:
+        path = os.path.join(self.template_dir, fname)
+        with open(path, 'rb') as f:
+            data = f.read()
+        with Image.open(path) as src:
+            src.draft('RGB', (self.side, self.side))
+            image = src.convert('RGB')
+        image.thumbnail((self.side, self.side), Image.Resampling.LANCZOS)
+        pixels = image.tobytes()
+        entry = {
+            "file": fname, "bytes": size, "mtime": mtime, "sha1": hashlib.sha1(data).hexdigest(),
+            "width": image.width, "height": image.height, "length": len(pixels),
+        }
+        return entry, pixels
+
+    def preload(self) -> list:
+        """Сканирует memes/, при необходимости пересобирает кэш и отображает его в память; возвращает имена"""
+        with self._lock:
+            if self._loaded:
+                return sorted(self._index)
+            found = self._scan()
+            cached = self._read_cached_index()
+            # Кэш годен, если набор файлов и их размеры/mtime совпали с индексом
+            fresh = (os.path.exists(os.path.join(self.cache_dir, PIXELS_FILE)) and set(cached) == set(found)
+                     and all(cached[n]["file"] == f and cached[n]["bytes"] == s and cached[n]["mtime"] == m
+                             for n, (f, s, m) in found.items()))
+            index = cached if fresh else self._build(found, cached)
+            tags = self._read_tags()
+            for name, entry in index.items():
+                entry["name"] = name
+                entry["tags"] = sorted(set(name_tags(name)) | set(tags.get(name, [])))
+            self._index = index
+            self._map()
+            self._loaded = True
+            logger.info(f"Шаблонов загружено: {len(index)} из {self.template_dir}")
+            return sorted(index)
+
+    def _map(self):
+        path = os.path.join(self.cache_dir, PIXELS_FILE)
+        if not self._index or not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        for name, e in self._index.items():
+            buf = view[e["offset"]:e["offset"] + e["length"]]
+            self._images[name] = Image.frombuffer('RGB', (e["width"], e["height"]), buf, 'raw', 'RGB', 0, 1)
+
+    # --- доступ ---
+    def names(self) -> list:
+        return self.preload()
+
+    def info(self, name: str) -> dict:
+        self.preload()
+        try:
+            return self._index[name.lower()]
+        except KeyError:
+            raise KeyError(f"Неизвестный шаблон: {name}") from None
+
+    def get(self, name: str) -> Image.Image:
+        """Картинка шаблона поверх mmap (только чтение) — рисовать на копии"""
+        self.info(name)
+        return self._images[name.lower()]
+
+    def digest(self, name: str) -> str:
+        return self.info(name)["sha1"]
+
+    def find(self, query: str) -> list:
+        """Имена шаблонов: точное совпадение имени, иначе по началу имени или тегу"""
+        self.preload()
+        query = query.strip().lower()
+        if query in self._index:
+            return [query]
+        words = name_tags(query)
+        return [name for name, e in sorted(self._index.items())
+                if name.startswith(query) or (words and all(any(t.startswith(w) for t in e["tags"]) for w in words))]
+
+
+# Один реестр на процесс (в воркерах пула — унаследованный от главного или свой при первом рендере)
+registry = TemplateRegistry(side=config.TEMPLATE_SIDE, cache_dir=config.TEMPLATE_CACHE_DIR)
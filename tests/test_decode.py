@@ -0,0 +1,22 @@
+import io
+
+import pytest
+from PIL import Image
+
+from decode import decode_image
+
+
+def png_bytes(mode: str, size: tuple = (1600, 1200)) -> bytes:
+    image = Image.effect_mandelbrot(size, (-2.2, -1.3, 0.9, 1.3), 64)
+    image = image.convert('I').convert('I;16') if mode == 'I;16' else image.convert(mode)
+    out = io.BytesIO()
+    image.save(out, format='PNG')
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("mode", ['P', '1', 'I;16', 'L', 'LA', 'RGBA', 'RGB'])
+def test_reduced_decode_of_any_png_mode(mode):
+    # Палитровые PNG/GIF и 16-битные картинки тоже уменьшаются при декодировании
+    image = decode_image(io.BytesIO(png_bytes(mode)), target_size=(400, 300))
+    assert image.mode == 'RGB'
+    assert image.size == (400, 300)
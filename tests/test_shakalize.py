@@ -0,0 +1,35 @@
+import io
+
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+import renderers
+from renderers import SHAKAL_LEVELS, SHAKAL_COLORS
+from warmup import synthetic_jpeg
+
+# Пути строят палитру по-разному (median cut на уменьшенном кадре против ADAPTIVE после цикла JPEG),
+# а две разные палитры на 64 цвета сами по себе расходятся в среднем на ~6 на канал. Замер на 640×480
+# и 1280×960: среднее |разница| в худшем канале до 12.5, смещение тона по каналу до 5.0.
+MAX_MEAN = 15
+MAX_TONE_SHIFT = 7
+
+
+@pytest.fixture(scope="module")
+def photo():
+    return Image.open(io.BytesIO(synthetic_jpeg((640, 480)))).convert('RGB')
+
+
+@pytest.mark.skipif(renderers.np is None, reason="нет NumPy")
+@pytest.mark.parametrize("intensity", list(SHAKAL_LEVELS))
+def test_numpy_path_matches_pillow(photo, intensity):
+    expected = renderers._shakalize_pillow(photo, photo.size, intensity)
+    actual = renderers._shakalize_numpy(photo, photo.size, intensity)
+
+    assert actual.size == expected.size
+    colors = actual.getcolors(SHAKAL_COLORS)
+    assert colors is not None, f"больше {SHAKAL_COLORS} цветов: {len(actual.getcolors(1 << 24))}"
+
+    mean = max(ImageStat.Stat(ImageChops.difference(expected, actual)).mean)
+    assert mean <= MAX_MEAN, f"среднее расхождение {mean:.2f}"
+    shift = max(abs(a - e) for a, e in zip(ImageStat.Stat(actual).mean, ImageStat.Stat(expected).mean))
+    assert shift <= MAX_TONE_SHIFT, f"смещение тона {shift:.2f}"
@@ -0,0 +1,70 @@
+import pytest
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+from fonts import registry
+from text_stroke import draw_outlined_text
+
+TEXT = "Когда забыл git push"
+BACKGROUND = (120, 160, 200)
+
+# Всё считается только по закрашенным пикселям (объединение текста и обводки в обеих картинках),
+# а не по всему холсту. Замер на Impact/Lobster/Roboto, 32–96px, ширина 1–4: среднее до 0.13,
+# максимум 4 — остаются только ошибки округления при умножении масок.
+MAX_MEAN = 0.5
+MAX_PIXEL = 8
+MAX_VISIBLE_SHARE = 0.001
+VISIBLE = 4
+
+
+def draw_reference(image: Image.Image, pos: tuple, text: str, font, width: int):
+    """Прежняя обводка: (2w+1)² вызовов draw.text со сдвигом, затем заливка"""
+    draw = ImageDraw.Draw(image)
+    x, y = pos
+    for dx in range(-width, width + 1):
+        for dy in range(-width, width + 1):
+            draw.text((x + dx, y + dy), text, font=font, fill=(0, 0, 0))
+    draw.text(pos, text, font=font, fill=(255, 255, 255))
+
+
+def channel_max(image: Image.Image) -> Image.Image:
+    r, g, b = image.split()
+    return ImageChops.lighter(ImageChops.lighter(r, g), b)
+
+
+@pytest.mark.parametrize("font_key", ["impact", "lobster", "roboto"])
+@pytest.mark.parametrize("size", [32, 64, 96])
+@pytest.mark.parametrize("width", [1, 2, 3, 4])
+def test_single_pass_outline_matches_reference(font_key, size, width):
+    if not registry.is_available(font_key):
+        pytest.skip(f"нет шрифта {font_key}")
+    font = registry.get(font_key, size)
+    expected = Image.new('RGB', (1000, 200), BACKGROUND)
+    actual = expected.copy()
+    draw_reference(expected, (20, 40), TEXT, font, width)
+    draw_outlined_text(actual, (20, 40), TEXT, font, width=width)
+
+    background = Image.new('RGB', expected.size, BACKGROUND)
+    inked = Image.eval(ImageChops.lighter(channel_max(ImageChops.difference(expected, background)),
+                                          channel_max(ImageChops.difference(actual, background))),
+                       lambda v: 255 if v else 0)
+    inked_area = inked.histogram()[255]
+    assert inked_area, "текст не нарисован"
+
+    diff = ImageChops.difference(expected, actual)
+    mean = max(ImageStat.Stat(diff, inked).mean)
+    peak = max(high for _, high in diff.getextrema())
+    visible = Image.eval(channel_max(diff), lambda v: 255 if v > VISIBLE else 0)
+    share = visible.histogram()[255] / inked_area
+
+    assert mean <= MAX_MEAN, f"среднее расхождение {mean:.3f}"
+    assert peak <= MAX_PIXEL, f"максимальное расхождение {peak}"
+    assert share <= MAX_VISIBLE_SHARE, f"заметно отличается {share:.2%} закрашенных пикселей"
+
+
+def test_zero_width_is_plain_text():
+    font = registry.get("impact", 48)
+    expected = Image.new('RGB', (600, 120), BACKGROUND)
+    actual = expected.copy()
+    ImageDraw.Draw(expected).text((10, 20), TEXT, font=font, fill=(255, 255, 255))
+    draw_outlined_text(actual, (10, 20), TEXT, font, width=0)
+    assert ImageChops.difference(expected, actual).getbbox() is None
@@ -0,0 +1,90 @@
+import weakref
+
+from fonts import get_font
+
+# === РАЗМЕТКА ТЕКСТА ===
+# Ширина каждого слова и пробела меряется один раз на шрифт (мемо по (шрифт, текст)),
+# строки собираются инкрементально суммой ширин, без повторного замера всей строки.
+
+_MEMO_LIMIT = 4096
+_advance_memo = weakref.WeakKeyDictionary()  # шрифт → {текст: ширина по advance}
+_ink_memo = weakref.WeakKeyDictionary()      # шрифт → {текст: правый край bbox}
+
+
+def _memo_for(store, font) -> dict:
+    memo = store.get(font)
+    if memo is None or len(memo) > _MEMO_LIMIT:
+        memo = store[font] = {}
+    return memo
+
+
+def measure(font, text: str) -> float:
+    """Ширина текста по advance (для сборки строк)"""
+    memo = _memo_for(_advance_memo, font)
+    width = memo.get(text)
+    if width is None:
+        width = memo[text] = font.getlength(text)
+    return width
+
+
+def line_width(font, text: str) -> int:
+    """Правый край bbox строки — как draw.textbbox((0, 0), text)[2], для центрирования"""
+    memo = _memo_for(_ink_memo, font)
+    width = memo.get(text)
+    if width is None:
+        width = memo[text] = font.getbbox(text)[2]
+    return width
+
+
+def wrap_text(text: str, font, max_width: int) -> list:
+    """Переносит текст по словам; слово шире max_width остаётся на своей строке"""
+    space = measure(font, ' ')
+    lines = []
+    line = []
+    current = 0.0
+    for word in text.split():
+        ww = measure(font, word)
+        if line and current + space + ww > max_width:
+            lines.append(' '.join(line))
+            line = [word]
+            current = ww
+        else:
+            current = current + space + ww if line else ww
+            line.append(word)
+    if line:
+        lines.append(' '.join(line))
+    return lines
+
+
+def _fits(lines: list, font, size: int, max_width: int, max_height: int, line_spacing: float) -> bool:
+    if len(lines) * int(size * line_spacing) > max_height:
+        return False
+    return all(line_width(font, line) <= max_width for line in lines)
+
+
+def fit_text(text: str, font_key: str, max_width: int, max_height: int,
+             max_size: int, min_size: int = 12, line_spacing: float = 1.3) -> tuple:
+    """Бинпоиск наибольшего размера шрифта, при котором текст влезает в рамку.
+
+    Возвращает (шрифт, размер, строки). Если не влезает даже min_size — отдаёт min_size.
+    """
+    min_size = min(min_size, max_size)
+    font = get_font(font_key, max_size)
+    lines = wrap_text(text, font, max_width)
+    if _fits(lines, font, max_size, max_width, max_height, line_spacing):
+        return font, max_size, lines
+    best = None
+    lo, hi = min_size, max_size - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        font = get_font(font_key, mid)
+        lines = wrap_text(text, font, max_width)
+        if _fits(lines, font, mid, max_width, max_height, line_spacing):
+            best = (font, mid, lines)
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    if best is None:
+        font = get_font(font_key, min_size)
+        best = (font, min_size, wrap_text(text, font, max_width))
+    return best
@@ -0,0 +1,41 @@
+from PIL import Image, ImageChops, ImageDraw
+
+# === ТЕКСТ С ОБВОДКОЙ ЗА ОДИН ПРОХОД ===
+# Строка растеризуется один раз в маску, обводка получается расширением маски.
+# (2w+1)² наложений со сдвигом дают непрозрачность 1 - Π(1 - a) по квадрату сдвигов; произведение
+# по квадрату раскладывается на строки и столбцы — 4w умножений маски вместо (2w+1)² растеризаций.
+
+
+def text_mask(text: str, font, pad: int = 0):
+    """Маска строки (L) с отступом pad и смещение её угла относительно точки вывода"""
+    left, top, right, bottom = font.getbbox(text)
+    mask = Image.new('L', (right - left + pad * 2, bottom - top + pad * 2), 0)
+    ImageDraw.Draw(mask).text((pad - left, pad - top), text, font=font, fill=255)
+    return mask, (left - pad, top - pad)
+
+
+def dilate(mask: Image.Image, width: int) -> Image.Image:
+    """Расширяет маску на width пикселей квадратным ядром так же, как наложение сдвинутых копий:
+    сглаженные края складываются, а не берётся максимум. Нужен отступ маски не меньше width —
+    ImageChops.offset заворачивает край по кругу."""
+    clear = ImageChops.invert(mask)  # прозрачность: 255 — фон
+    for step in ((0, 1), (1, 0)):
+        acc = clear
+        for d in range(1, width + 1):
+            acc = ImageChops.multiply(acc, ImageChops.offset(clear, step[0] * d, step[1] * d))
+            acc = ImageChops.multiply(acc, ImageChops.offset(clear, -step[0] * d, -step[1] * d))
+        clear = acc
+    return ImageChops.invert(clear)
+
+
+def draw_outlined_text(image: Image.Image, pos: tuple, text: str, font,
+                       fill=(255, 255, 255), outline=(0, 0, 0), width: int = 2):
+    """Рисует строку с обводкой: одна растеризация + расширение маски + две вклейки"""
+    if not text:
+        return
+    x, y = pos
+    mask, (dx, dy) = text_mask(text, font, pad=width)
+    origin = (x + dx, y + dy)
+    if width > 0:
+        image.paste(outline, origin, dilate(mask, width))
+    image.paste(fill, origin, mask)
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: object):
+    """Ключ сериализации: сессии мастера живут по user_id, без пользователя — по чату.
+    Инлайн-запросы без сессии и без очереди: устаревшие отбрасывает сам обработчик, а в очереди
+    пользователя они копились бы по одному на каждую букву"""
+    if not isinstance(update, Update) or update.inline_query is not None:
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+# === ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА С ПОРЯДКОМ ВНУТРИ ПОЛЬЗОВАТЕЛЯ ===
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Апдейты разных пользователей обрабатываются параллельно, одного пользователя — строго по очереди.
+
+    На каждый активный ключ — asyncio.Lock (FIFO), он удаляется, как только апдейтов ключа не осталось.
+    Общий лимит max_concurrent берётся уже после блокировки пользователя, чтобы ожидающие своей
+    очереди апдейты одного пользователя не занимали слоты других. max_pending — сколько апдейтов
+    PTB может держать в обработке/ожидании одновременно.
+
+    sessions (SessionStore) — сессия пользователя подтягивается из общего хранилища перед
+    апдейтом и сохраняется после, под той же блокировкой: один запрос на чтение и не больше
+    одного на запись за апдейт, сколько бы раз обработчики ни обращались к сессии.
+    """
+
+    __slots__ = ("max_concurrent", "sessions", "_active", "_locks", "running", "processed")
+
+    def __init__(self, max_concurrent: int = 64, max_pending: int = 1024, sessions=None):
+        super().__init__(max(max_pending, max_concurrent, 2))
+        self.max_concurrent = max_concurrent
+        self.sessions = sessions
+        self._active = asyncio.Semaphore(max_concurrent)
+        self._locks = {}  # ключ -> [lock, число апдейтов в работе и в очереди]
+        self.running = 0
+        self.processed = 0
+
+    async def _run(self, coroutine):
+        async with self._active:
+            self.running += 1
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                self.processed += 1
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = update_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+        # Сессии мастера есть только у сообщений и нажатий кнопок (не у инлайн-запросов)
+        await self.run_locked(key, coroutine, stateful=update.message is not None or update.callback_query is not None)
+
+    async def run_locked(self, key, coroutine, stateful: bool = True) -> None:
+        """Выполняет coroutine в очереди ключа, как апдейт этого пользователя: для работы вне
+        апдейтов (альбом по таймеру), чтобы она не перемежалась с его апдейтами"""
+        slot = self._locks.get(key)
+        if slot is None:
+            slot = self._locks[key] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        stateful = stateful and self.sessions is not None
+        try:
+            async with slot[0]:
+                if stateful:
+                    await self.sessions.load(key)
+                try:
+                    await self._run(coroutine)
+                finally:
+                    if stateful:
+                        await self.sessions.save(key)
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._locks:
+            logger.info(f"Остановка обработки: в очереди апдейты {len(self._locks)} пользователей")
+
+    def stats(self) -> dict:
+        return {
+            "active_keys": len(self._locks),
+            "in_flight": self.current_concurrent_updates,
+            "running": self.running,
+            "processed": self.processed,
+        }
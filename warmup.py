@@ -0,0 +1,99 @@
+import asyncio
+import contextlib
+import io
+import logging
+import time
+
+from PIL import Image
+
+import metrics
+from fonts import DEMOTIVATOR_FONTS, CLASSIC_FONTS
+from renderers import SHAKAL_LEVELS
+
+logger = logging.getLogger(__name__)
+
+WARMUP_FONT_SIZE = 40
+# Рендер → параметры: по одному на каждый движок и каждый уровень шакализации
+WARMUP_JOBS = [
+    ("classic", dict(top_text="Прогрев", bottom_text="Прогрев", font_key=CLASSIC_FONTS[0])),
+    ("demotivator", dict(top_text="Прогрев", bottom_text="Прогрев", font_key=DEMOTIVATOR_FONTS[0])),
+] + [("shakalize", dict(intensity=level)) for level in SHAKAL_LEVELS]
+
+
+# === СИНТЕТИЧЕСКИЕ КАРТИНКИ ===
+def synthetic_jpeg(size: tuple) -> bytes:
+    """Детерминированная «фотография»: фрактал + градиенты, чтобы JPEG был реалистичного размера"""
+    w, h = size
+    detail = Image.effect_mandelbrot((w, h), (-2.2, -1.3, 0.9, 1.3), 64)
+    horizontal = Image.linear_gradient('L').rotate(90).resize((w, h))
+    radial = Image.radial_gradient('L').resize((w, h))
+    image = Image.merge('RGB', (detail, horizontal, radial))
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=90)
+    return out.getvalue()
+
+
+# === ХОЛОДНЫЙ СТАРТ ===
+class Startup:
+    """Фазы запуска с замером времени; ready — бот прогрет и может принимать апдейты"""
+
+    def __init__(self):
+        self.ready = False
+        self.phases = {}  # фаза → секунды
+        self._started = time.monotonic()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+            logger.info(f"Запуск: {name} — {self.phases[name] * 1000:.0f} мс")
+
+    def finish(self):
+        self.ready = True
+        total = time.monotonic() - self._started
+        details = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in self.phases.items())
+        logger.info(f"Бот готов за {total:.2f} с ({details})")
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "phases_ms": {k: round(v * 1000, 1) for k, v in self.phases.items()}}
+
+
+def warm_fonts(registry) -> list:
+    """Все шрифты: файлы в память и FreeType-объект на каждый (инициализация FreeType, кэш размеров).
+    Возвращает недоступные ключи."""
+    missing = registry.preload()
+    for key in registry.font_files:
+        registry.get(key, WARMUP_FONT_SIZE).getbbox("Прогрев Ag")
+    Image.init()  # все плагины Pillow сразу, а не при первом открытии файла
+    return missing
+
+
+async def warm_renders(pool, side: int = 640, output: str = "jpeg") -> int:
+    """По рендеру на каждый движок в каждом воркере: процессы пула запускаются и импортируют
+    Pillow/NumPy, заполняют свои кэши шрифтов и подложек. Возвращает число неудачных рендеров.
+
+    Задачи уходят пачками по pool.workers: так ни одна не ждёт в очереди и лимит очереди пула
+    (RENDER_QUEUE_MAX) не срабатывает при любом числе ядер, а первая пачка поднимает все процессы."""
+    data = synthetic_jpeg((side, side * 3 // 4))
+    # ProcessPoolExecutor поднимает процессы по мере нужды: раунд на воркер раздаёт задачи всем
+    rounds = pool.workers if pool.mode == "process" else 1
+    jobs = [job for _ in range(rounds) for job in WARMUP_JOBS]
+
+    async def render(engine: str, params: dict):
+        # Метки — своей задаче: прогрев не смешивается с рендерами пользователей в гистограммах
+        metrics.set_request_labels(renderer=f"{engine}_warmup", chat_type="")
+        if engine != "shakalize":
+            params = dict(params, output=output)
+        await pool.submit(engine, data, **params)
+
+    failed = []
+    for i in range(0, len(jobs), pool.workers):
+        results = await asyncio.gather(*(render(engine, params) for engine, params in jobs[i:i + pool.workers]),
+                                       return_exceptions=True)
+        failed += [r for r in results if isinstance(r, BaseException)]
+    for error in failed[:3]:
+        logger.warning(f"Прогревочный рендер не удался: {error!r}")
+    return len(failed)
@@ -0,0 +1,99 @@
+import asyncio
+import hmac
+import logging
+import signal
+from urllib.parse import urlsplit
+
+from telegram import Update
+from telegram.ext import Application
+
+from http_server import HttpServer, json_response
+
+logger = logging.getLogger(__name__)
+
+# Бот обрабатывает только сообщения, нажатия кнопок и инлайн-запросы — остальные типы Telegram не присылает
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.INLINE_QUERY]
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+HEALTH_PATH = "/healthz"
+READY_PATH = "/readyz"
+
+
+def webhook_path(url: str) -> str:
+    return urlsplit(url).path or "/"
+
+
+def make_webhook_handler(app: Application, secret: str):
+    async def handle(request):
+        # Telegram присылает секрет, заданный в setWebhook, в каждом запросе
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            logger.warning("Webhook: неверный секретный токен")
+            return json_response({"ok": False}, 401)
+        try:
+            update = Update.de_json(request.json(), app.bot)
+        except ValueError as e:
+            logger.warning(f"Webhook: некорректный апдейт: {e}")
+            return json_response({"ok": False}, 400)
+        if update is not None:
+            await app.update_queue.put(update)
+        return json_response({"ok": True})
+    return handle
+
+
+def make_health_handler(app: Application, startup=None):
+    async def handle(request):
+        if startup is not None and not startup.ready:
+            state = "starting"
+        else:
+            state = "ok" if app.running else "stopped"
+        return json_response({"status": state, "mode": "webhook", "update_queue": app.update_queue.qsize()},
+                             200 if state == "ok" else 503)
+    return handle
+
+
+def make_ready_handler(startup):
+    """503 с фазами запуска, пока идёт прогрев (warmup.Startup), затем 200"""
+    async def handle(request):
+        return json_response(startup.status(), 200 if startup.ready else 503)
+    return handle
+
+
+# === ЗАПУСК В РЕЖИМЕ WEBHOOK ===
+async def serve_webhook(app: Application, url: str, listen: str, port: int, secret: str,
+                        max_connections: int = 40, stop_event: asyncio.Event = None, startup=None):
+    """Поднимает HTTP-приёмник, регистрирует webhook и работает до сигнала остановки.
+
+    Жизненный цикл повторяет run_polling: initialize → post_init → start … stop → shutdown → post_shutdown.
+    Приёмник слушает уже во время post_init: если передан startup (warmup.Startup), балансировщик
+    видит прогрев на HEALTH_PATH и READY_PATH как 503, а апдейты ждут в очереди до app.start().
+    """
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: остановка по Ctrl+C через KeyboardInterrupt
+
+    server = HttpServer(listen, port)
+    server.route("POST", webhook_path(url), make_webhook_handler(app, secret))
+    server.route("GET", HEALTH_PATH, make_health_handler(app, startup))
+    if startup is not None:
+        server.route("GET", READY_PATH, make_ready_handler(startup))
+
+    await app.initialize()
+    try:
+        await server.start()
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        await app.bot.set_webhook(url=url, secret_token=secret or None, allowed_updates=ALLOWED_UPDATES,
+                                  max_connections=max_connections)
+        logger.info(f"Webhook зарегистрирован: {url}")
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        if app.running:
+            await app.stop()
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
@@ -0,0 +1,223 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from fonts import font_title, DEMOTIVATOR_FONTS, CLASSIC_FONTS
+from renderers import FONT_SIZES, BORDER_THICKNESS, SHAKAL_LEVELS, SHAKAL_TITLES
+
+# === МАСТЕР: ШАГИ, ПЕРЕХОДЫ И КЛАВИАТУРЫ ===
+# Всё строится один раз при импорте: нажатие кнопки — поиск callback_data в DISPATCH и готовая
+# клавиатура, без сборки кнопок и перебора ключей сессии. Текущий шаг хранится в ud['step'].
+
+BACK = "action_back"
+CANCEL = "action_cancel"
+MENU = "menu"            # выбор действия после фото/GIF/шаблона
+SHAKALIZE = "shakalize"  # выбор уровня шакализации
+TEXT = "text"            # мастер пройден, ждём текст
+
+NAV_ROW = [InlineKeyboardButton("Назад", callback_data=BACK), InlineKeyboardButton("Отмена", callback_data=CANCEL)]
+
+
+def _rows(buttons: list, columns: int) -> list:
+    return [buttons[i:i + columns] for i in range(0, len(buttons), columns)]
+
+
+class Step:
+    """Шаг мастера: варианты (callback_data, подпись, значение в ud[key]) и готовая клавиатура"""
+
+    __slots__ = ("name", "key", "prompt", "chosen", "options", "titles", "keyboard")
+
+    def __init__(self, name: str, key: str, prompt: str, chosen: str, options: list, columns: int = 1):
+        self.name = name
+        self.key = key
+        self.prompt = prompt    # текст над клавиатурой шага
+        self.chosen = chosen    # подпись выбранного значения в тексте следующего шага
+        self.options = {data: value for data, _, value in options}
+        self.titles = {data: title for data, title, _ in options}
+        buttons = [InlineKeyboardButton(title, callback_data=data) for data, title, _ in options]
+        self.keyboard = InlineKeyboardMarkup(_rows(buttons, columns) + [NAV_ROW])
+
+
+STEPS = {step.name: step for step in (
+    # --- классический мем ---
+    Step("classic_font", "classic_font", "Выбери шрифт:", "Шрифт",
+         [(f"classic_font_{key}", font_title(key), key) for key in CLASSIC_FONTS]),
+    Step("classic_type", "classic_type", "Выбери тип:", "Тип", [
+        ("classic_type_normal", "Верх+низ", "classic_type_normal"),
+        ("classic_type_bottom_only", "Только низ", "classic_type_bottom_only"),
+    ]),
+    # --- демотиватор ---
+    Step("font", "font_key", "Выбери шрифт:", "Шрифт",
+         [(f"font_{key}", font_title(key), key) for key in DEMOTIVATOR_FONTS], columns=2),
+    Step("type", "demotivator_type", "Выбери тип:", "Тип", [
+        ("type_normal", "Обычный (верх+низ)", "type_normal"),
+        ("type_bottom_only", "Только снизу", "type_bottom_only"),
+    ]),
+    Step("size", "font_size", "Выбери размер:", "Размер", [
+        (data, title, FONT_SIZES[data]) for data, title in (
+            ("size_small", "Маленький"), ("size_medium", "Средний"),
+            ("size_large", "Большой"), ("size_xlarge", "Очень большой"),
+        )
+    ], columns=2),
+    Step("color", "font_color", "Выбери цвет текста:", "Цвет текста", [
+        (f"color_{value}", title, value) for value, title in (
+            ("red", "Красный"), ("white", "Белый"), ("yellow", "Жёлтый"), ("orange", "Оранжевый"),
+            ("blue", "Синий"), ("green", "Зелёный"), ("purple", "Фиолетовый"), ("brown", "Коричневый"),
+            ("black", "Чёрный"), ("gray", "Серый"), ("pink", "Розовый"),
+        )
+    ], columns=2),
+    Step("bg", "bg_color", "Выбери фон:", "Фон", [
+        ("bg_black", "Чёрный (классика)", (0, 0, 0)), ("bg_white", "Белый", (255, 255, 255)),
+        ("bg_dark_gray", "Тёмно-серый", (50, 50, 50)), ("bg_light_gray", "Светло-серый", (200, 200, 200)),
+        ("bg_blue", "Синий", (0, 0, 139)), ("bg_green", "Зелёный", (0, 100, 0)),
+    ], columns=2),
+    Step("thickness", "border_thickness", "Выбери рамку:", "Рамка", [
+        (data, title, BORDER_THICKNESS[data]) for data, title in (
+            ("thickness_thin", "Тонкая (4px)"), ("thickness_normal", "Обычная (10px)"),
+            ("thickness_thick", "Толстая (20px)"), ("thickness_xthick", "Очень толстая (30px)"),
+        )
+    ], columns=2),
+)}
+
+# Тип мема → (название, шаги по порядку); оба мастера строятся из одной таблицы
+FLOWS = {
+    "meme_classic": ("Классический мем", ("classic_font", "classic_type")),
+    "meme_demotivator": ("Демотиватор", ("font", "type", "size", "color", "bg", "thickness")),
+}
+FLOW_STEPS = frozenset(name for _, steps in FLOWS.values() for name in steps)
+
+# Шаг → (следующий шаг или None, предыдущий шаг или None) внутри своего мастера
+_TRANSITIONS = {
+    name: (steps[i + 1] if i + 1 < len(steps) else None, steps[i - 1] if i else None)
+    for _, steps in FLOWS.values() for i, name in enumerate(steps)
+}
+
+# === МЕНЮ ВЫБОРА ДЕЙСТВИЯ ===
+_MENU_BUTTONS = {
+    "meme_classic": InlineKeyboardButton("Классический мем", callback_data="meme_classic"),
+    "meme_demotivator": InlineKeyboardButton("Демотиватор", callback_data="meme_demotivator"),
+    "shakalize_menu": InlineKeyboardButton("Зашакалить", callback_data="shakalize_menu"),
+}
+# Источник → кнопки меню: GIF/видео — только классический мем, шаблон не шакалим
+_MENU_ITEMS = {
+    "photo": ("meme_classic", "meme_demotivator", "shakalize_menu"),
+    "animation": ("meme_classic",),
+    "template": ("meme_classic", "meme_demotivator"),
+}
+# Первое меню (сразу после фото) — без отмены, как раньше; при возврате «Назад» — с отменой
+MENUS = {source: InlineKeyboardMarkup([[_MENU_BUTTONS[i]] for i in items]) for source, items in _MENU_ITEMS.items()}
+MENUS_BACK = {
+    source: InlineKeyboardMarkup([[_MENU_BUTTONS[i]] for i in items] +
+                                 [[InlineKeyboardButton("Отмена", callback_data=CANCEL)]])
+    for source, items in _MENU_ITEMS.items()
+}
+# Шаблон выбирается командой — отмена есть сразу
+MENUS["template"] = MENUS_BACK["template"]
+
+# === ШАКАЛИЗАЦИЯ ===
+SHAKALIZE_LEVEL_ROWS = _rows([InlineKeyboardButton(SHAKAL_TITLES[level], callback_data=f"shakalize_{level}")
+                              for level in SHAKAL_LEVELS], 2)
+SHAKALIZE_LEVELS = InlineKeyboardMarkup(SHAKALIZE_LEVEL_ROWS)
+SHAKALIZE_MENU = InlineKeyboardMarkup(
+    SHAKALIZE_LEVEL_ROWS + [[InlineKeyboardButton("Превью всех уровней", callback_data="shakalize_preview")], NAV_ROW])
+
+# === ТАБЛИЦА ДИСПЕТЧЕРИЗАЦИИ: callback_data → (шаг, значение) ===
+DISPATCH = {data: (name, value) for name, step in STEPS.items() for data, value in step.options.items()}
+DISPATCH.update({flow: (MENU, flow) for flow in FLOWS})
+DISPATCH["shakalize_menu"] = (MENU, SHAKALIZE)
+
+
+def source_of(ud: dict) -> str:
+    if 'animation' in ud:
+        return "animation"
+    if 'template' in ud:
+        return "template"
+    return "photo"
+
+
+def start(ud: dict) -> InlineKeyboardMarkup:
+    """Новое фото/GIF/шаблон: мастер с начала — клавиатура меню выбора действия"""
+    for key in ['meme_type'] + [step.key for step in STEPS.values()]:
+        ud.pop(key, None)
+    ud['step'] = MENU
+    return MENUS[source_of(ud)]
+
+
+def route(data: str) -> str:
+    """Имя шага для callback_data (метка метрики); кнопки вне мастера — по префиксу"""
+    if data in (BACK, CANCEL):
+        return data[len("action_"):]
+    hit = DISPATCH.get(data)
+    if hit is not None:
+        return hit[0]
+    if data.startswith("shakalize_"):
+        return SHAKALIZE
+    if data.startswith("tpl_"):
+        return "template"
+    return "unknown"
+
+
+def text_prompt(ud: dict) -> str:
+    bottom_only = ud.get('classic_type') == 'classic_type_bottom_only' if ud.get('meme_type') == 'meme_classic' \
+        else ud.get('demotivator_type') == 'type_bottom_only'
+    return "Отправь текст (только снизу)." if bottom_only else "Отправь текст: 'Верхний|Нижний'"
+
+
+def choose(ud: dict, data: str):
+    """Выбор варианта на текущем шаге → (текст, клавиатура) следующего экрана.
+
+    None — кнопка не текущего шага (старое сообщение, повторное нажатие): сессию не трогаем.
+    Переход в шакализацию возвращает SHAKALIZE_MENU; сам рендер — в bot.py.
+    """
+    name, value = DISPATCH[data]
+    if name != ud.get('step'):
+        return None
+    if name == MENU:
+        if value == SHAKALIZE:
+            if source_of(ud) != "photo":
+                return None
+            ud['step'] = SHAKALIZE
+            return "Выбери уровень шакализации:", SHAKALIZE_MENU
+        if value not in _MENU_ITEMS[source_of(ud)]:
+            return None
+        title, steps = FLOWS[value]
+        ud['meme_type'] = value
+        ud['step'] = steps[0]
+        return f"Выбран: **{title}**\n\n{STEPS[steps[0]].prompt}", STEPS[steps[0]].keyboard
+
+    step = STEPS[name]
+    ud[step.key] = value
+    chosen = f"{step.chosen}: **{step.titles[data]}**\n\n"
+    following = _TRANSITIONS[name][0]
+    if following is None:
+        ud['step'] = TEXT
+        return chosen + text_prompt(ud), None
+    ud['step'] = following
+    return chosen + STEPS[following].prompt, STEPS[following].keyboard
+
+
+def back(ud: dict):
+    """«Назад» — ровно на один шаг: значение предыдущего шага снимается, показывается его клавиатура.
+    None — возвращаться некуда (меню или мастер уже пройден)."""
+    current = ud.get('step')
+    if current == SHAKALIZE:
+        ud['step'] = MENU
+        return "Выбери тип:", MENUS_BACK[source_of(ud)]
+    if current not in FLOW_STEPS:
+        return None
+    previous = _TRANSITIONS[current][1]
+    if previous is None:
+        ud.pop('meme_type', None)
+        ud['step'] = MENU
+        return "Выбери тип:", MENUS_BACK[source_of(ud)]
+    step = STEPS[previous]
+    ud.pop(step.key, None)
+    ud['step'] = previous
+    return step.prompt, step.keyboard
+
+
+def jump(ud: dict, name: str):
+    """Сразу к шагу name своего мастера (команда /size); None — шага нет в выбранном мастере"""
+    flow = FLOWS.get(ud.get('meme_type'))
+    if flow is None or name not in flow[1]:
+        return None
+    ud['step'] = name
+    return STEPS[name].prompt, STEPS[name].keyboard